@@ -0,0 +1,204 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+GENERATION_KEY = 'generation:{}'
+# Время последнего сдвига поколения - для Last-Modified страниц.
+# Тот же префикс: копии в памяти процессов сбрасываются вместе.
+CHANGED_KEY = 'generation:changed:{}'
+# Префикс, а не суффикс: блокировки не должны попадать под
+# LOCAL_PREFIXES двухуровневого кеша вместе с самими значениями.
+LOCK_KEY = 'lock:{}'
+
+
+def _generation_key(name):
+    # Имена содержат slug и username: хешируем, чтобы ключ был
+    # допустимым для любого бэкенда кеша.
+    return GENERATION_KEY.format(hashlib.md5(name.encode()).hexdigest())
+
+
+def _changed_key(name):
+    return CHANGED_KEY.format(hashlib.md5(name.encode()).hexdigest())
+
+
+def _new_generation():
+    # Начальное значение от времени: если ключ поколения вытеснен
+    # из кеша, новое поколение не совпадёт ни с одним старым.
+    return time.time_ns()
+
+
+def get_generations(names):
+    """Текущие поколения для списка имён вида 'group:slug'."""
+    keys = [_generation_key(name) for name in names]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            value = _new_generation()
+            if not cache.add(key, value, None):
+                value = cache.get(key, value)
+            generations[key] = value
+    return [generations[key] for key in keys]
+
+
+def bump_generations(*names):
+    """Сдвигает поколения: всё, что закешировано под старыми, устаревает.
+    Копии поколений в памяти процессов (TwoTierCache) сбрасываются во
+    всех процессах.
+    """
+    for name in names:
+        key = _generation_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_generation(), None)
+    now = time.time()
+    cache.set_many({_changed_key(name): now for name in names}, None)
+    clear_local = getattr(cache, 'clear_local', None)
+    if clear_local is not None:
+        clear_local()
+
+
+def last_changed(names):
+    """Время последнего bump_generations любого из names. Если время
+    вытеснено из кеша, считаем, что поколение сдвинулось сейчас.
+    """
+    keys = [_changed_key(name) for name in names]
+    times = cache.get_many(keys)
+    now = time.time()
+    for key in keys:
+        if key not in times:
+            times[key] = now if cache.add(key, now, None) else cache.get(
+                key, now)
+    return max(times.values(), default=None)
+
+
+def generation_key(names):
+    """Строка для ключа кеша, которая меняется при bump_generations.
+    Сами имена в неё не входят: их определяет адрес страницы.
+    """
+    return 'gen.' + '.'.join(map(str, get_generations(names)))
+
+
+def _wait_for(key, lock_key):
+    """Ждёт, пока другой процесс досчитает значение под блокировкой."""
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(settings.CACHE_LOCK_POLL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.get(lock_key) is None:
+            break
+    return None
+
+
+def single_flight(key, compute, timeout, cacheable=None):
+    """Значение из кеша с защитой от одновременного пересчёта.
+
+    Пересчитывает только тот, кто взял блокировку LOCK_KEY. Пока он
+    считает, остальные отдают устаревшее значение (оно хранится ещё
+    CACHE_STALE_TIMEOUT секунд после timeout), а если значения нет
+    совсем - ждут его не дольше CACHE_LOCK_TIMEOUT.
+    """
+    lock_key = LOCK_KEY.format(key)
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if fresh_until is None or time.time() < fresh_until:
+            return value
+        if not cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT):
+            return value
+    elif not cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT):
+        entry = _wait_for(key, lock_key)
+        if entry is not None:
+            return entry[0]
+        return compute()
+    try:
+        value = compute()
+        if cacheable is None or cacheable(value):
+            if timeout is None:
+                cache.set(key, (value, None), None)
+            else:
+                cache.set(key, (value, time.time() + timeout),
+                          timeout + settings.CACHE_STALE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+def _cacheable_response(response):
+    return response.status_code == 200 and not response.cookies
+
+
+def cache_page_generations(timeout, *scopes):
+    """Кеширует страницу с учётом поколений scopes и single_flight.
+
+    Шаблоны scopes заполняются аргументами view, например 'group:{slug}';
+    bump_generations('group:<slug>') сразу сбрасывает закешированные
+    страницы, поэтому timeout может быть большим. Страница кешируется
+    отдельно для каждого пользователя: в шапке выводится его имя.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            names = [scope.format(**kwargs) for scope in scopes]
+            raw_key = ':'.join((
+                generation_key(names),
+                request.get_full_path(),
+                str(request.user.pk or ''),
+            ))
+            key = 'page:' + hashlib.md5(raw_key.encode()).hexdigest()
+            return single_flight(
+                key, lambda: view(request, *args, **kwargs), timeout,
+                cacheable=_cacheable_response)
+        return wrapper
+    return decorator
+
+
+def conditional_page(freshness):
+    """Отвечает 304 Not Modified, не вызывая view, если у клиента
+    свежая копия страницы.
+
+    freshness(**kwargs) по аргументам view дёшево возвращает пару
+    (last_modified, token): время последнего изменения страницы
+    в секундах (или None) и строку, которая меняется вместе с ней.
+    ETag строится из token, адреса и пользователя: в шапке выводится
+    его имя. Last-Modified в заголовке с точностью до секунды, поэтому
+    его нет, пока идёт секунда последнего изменения: второе изменение
+    в ту же секунду его бы не сдвинуло. Ответ помечается no-cache,
+    чтобы браузер всегда переспрашивал, а не угадывал свежесть
+    по Last-Modified.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            last_modified, token = freshness(**kwargs)
+            raw_etag = ':'.join((
+                token, request.get_full_path(), str(request.user.pk or '')))
+            etag = '"%s"' % hashlib.md5(raw_etag.encode()).hexdigest()
+            timestamp = None
+            if last_modified is not None and (
+                    int(last_modified) < int(time.time())):
+                timestamp = int(last_modified)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            if timestamp:
+                response['Last-Modified'] = http_date(timestamp)
+            patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
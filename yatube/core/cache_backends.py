@@ -0,0 +1,468 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# SQLite ограничивает число параметров запроса.
+CHUNK_SIZE = 500
+
+# Файл рассылки сбросов растёт на байт за сброс; дальше он обнуляется.
+INVALIDATION_FILE_LIMIT = 64 * 1024
+
+# Локальные копии общие для всех потоков процесса, как у LocMemCache:
+# django.core.cache.caches создаёт бэкенд в каждом потоке заново.
+_local_stores = {}
+_MISSING = object()
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite в режиме WAL, общий для всех процессов хоста.
+
+    LOCATION - путь к файлу. Записи вытесняются по сроку и по давности
+    обращения (LRU), когда их больше MAX_ENTRIES. Число записей
+    (COUNT(*) - полный проход по таблице) проверяется не на каждой
+    записи, а раз в CULL_CHECK_INTERVAL записей этого экземпляра, по
+    умолчанию MAX_ENTRIES / 100: таблица может ненадолго превысить
+    MAX_ENTRIES на столько на каждый процесс. Целые числа хранятся как
+    INTEGER, поэтому incr - один атомарный UPDATE.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+    """
+    # Время последнего обращения обновляется не чаще раза в столько
+    # секунд: иначе каждое чтение превращалось бы в запись.
+    ACCESS_RESOLUTION = 5
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        options = params.get('OPTIONS', {})
+        self._cull_interval = options.get(
+            'CULL_CHECK_INTERVAL', max(1, self._max_entries // 100))
+        self._writes = 0
+
+    @property
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # Соединение SQLite нельзя переносить через fork.
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self._path, timeout=30,
+                                     isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'expires REAL, accessed REAL NOT NULL)')
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+        return connection
+
+    def _execute(self, sql, params=()):
+        return self._connection.execute(sql, params)
+
+    @staticmethod
+    def _dumps(value):
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _loads(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _live(self, now):
+        return '(expires IS NULL OR expires > %r)' % now
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction():
+            self._execute('DELETE FROM cache WHERE key = ? AND NOT '
+                          + self._live(now), (key,))
+            added = self._execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)',
+                (key, self._dumps(value),
+                 self.get_backend_timeout(timeout), now),
+            ).rowcount
+        if added:
+            self._written(1)
+        return bool(added)
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._get_many([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        values = self._get_many(list(keys))
+        return {keys[key]: value for key, value in values.items()}
+
+    def _get_many(self, keys):
+        now = time.time()
+        values = {}
+        touched = []
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            rows = self._execute(
+                'SELECT key, value, accessed FROM cache WHERE key IN (%s) '
+                'AND %s' % (','.join('?' * len(chunk)), self._live(now)),
+                chunk,
+            )
+            for key, value, accessed in rows:
+                values[key] = self._loads(value)
+                if now - accessed > self.ACCESS_RESOLUTION:
+                    touched.append((now, key))
+        if touched:
+            self._connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?', touched)
+        return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        rows = [(self._key(key, version), self._dumps(value), expires, now)
+                for key, value in data.items()]
+        with self._transaction():
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', rows)
+        self._written(len(rows))
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        return bool(self._execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND '
+            + self._live(now),
+            (self.get_backend_timeout(timeout), now, key),
+        ).rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction():
+            updated = self._execute(
+                'UPDATE cache SET value = value + ?, accessed = ? '
+                "WHERE key = ? AND typeof(value) = 'integer' AND "
+                + self._live(now),
+                (delta, now, key),
+            ).rowcount
+            if updated:
+                return self._execute('SELECT value FROM cache WHERE key = ?',
+                                     (key,)).fetchone()[0]
+            # Значение сохранено через pickle (или его нет).
+            row = self._execute(
+                'SELECT value FROM cache WHERE key = ? AND '
+                + self._live(now),
+                (key,),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = self._loads(row[0]) + delta
+            self._execute('UPDATE cache SET value = ?, accessed = ? '
+                          'WHERE key = ?', (self._dumps(value), now, key))
+            return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._execute(
+            'SELECT 1 FROM cache WHERE key = ? AND ' + self._live(time.time()),
+            (key,),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            self._execute('DELETE FROM cache WHERE key IN (%s)'
+                          % ','.join('?' * len(chunk)), chunk)
+
+    def clear(self):
+        self._execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живёт весь процесс: открывать его на каждый
+        # запрос дороже, чем держать.
+        pass
+
+    def _written(self, rows):
+        """Запускает _cull раз в CULL_CHECK_INTERVAL записанных строк."""
+        self._writes += rows
+        if self._writes >= self._cull_interval:
+            self._writes = 0
+            self._cull()
+
+    def _cull(self):
+        """Удаляет просроченные записи, а при переполнении ещё
+        и самые давно прочитанные: MAX_ENTRIES / CULL_FREQUENCY штук.
+        """
+        count = self._execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        now = time.time()
+        with self._transaction():
+            # Другой процесс мог почистить таблицу после подсчёта выше.
+            self._execute('DELETE FROM cache WHERE NOT ' + self._live(now))
+            count = self._execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            excess = count - self._max_entries
+            if excess <= 0:
+                return
+            if self._cull_frequency:
+                excess += self._max_entries // self._cull_frequency
+            self._execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY accessed LIMIT ?)', (excess,))
+
+    def _transaction(self):
+        return _Transaction(self._connection)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT: блокировка записи на всю операцию."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class _LocalStore:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.signature = _MISSING
+
+
+class TwoTierCache(BaseCache):
+    """Небольшой LRU в памяти процесса перед общим кешем.
+
+    LOCATION - алиас общего кеша в CACHES. В памяти хранятся только
+    ключи с префиксами LOCAL_PREFIXES, не больше MAX_ENTRIES штук и не
+    дольше LOCAL_TIMEOUT секунд. clear_local() сбрасывает локальные копии
+    во всех процессах: дописывает байт в INVALIDATION_FILE, а каждый
+    процесс перед обращением к кешу сверяет os.stat() этого файла.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.TwoTierCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {
+                'LOCAL_PREFIXES': ['generation:', 'page:'],
+                'INVALIDATION_FILE': '/var/tmp/yatube-cache.invalidate',
+            },
+        },
+        'shared': {...},
+    }
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self._prefixes = tuple(options.get('LOCAL_PREFIXES', ()))
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._invalidation_file = options.get('INVALIDATION_FILE')
+        self._store = _local_stores.setdefault(
+            (location, self._invalidation_file), _LocalStore())
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _local_key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _is_local(self, key):
+        return isinstance(key, str) and key.startswith(self._prefixes)
+
+    def _signature(self):
+        if self._invalidation_file is None:
+            return None
+        try:
+            stat = os.stat(self._invalidation_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _sync(self):
+        """Забывает локальные копии, если другой процесс их сбросил."""
+        signature = self._signature()
+        store = self._store
+        if signature != store.signature:
+            with store.lock:
+                store.entries.clear()
+                store.signature = signature
+
+    def _get_local(self, key):
+        store = self._store
+        with store.lock:
+            entry = store.entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if expires <= time.monotonic():
+                del store.entries[key]
+                return _MISSING
+            store.entries.move_to_end(key)
+        return pickle.loads(value)
+
+    def _set_local(self, values, timeout=DEFAULT_TIMEOUT):
+        self._sync()
+        timeout = self.get_backend_timeout(timeout)
+        lifetime = self._local_timeout
+        if timeout is not None:
+            lifetime = min(lifetime, timeout - time.time())
+        if lifetime <= 0:
+            self._delete_local(values)
+            return
+        expires = time.monotonic() + lifetime
+        # pickle, как и в LocMemCache: иначе запросы делили бы
+        # один изменяемый объект, например HttpResponse.
+        values = {key: (expires, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                  for key, value in values.items()}
+        store = self._store
+        with store.lock:
+            for key, entry in values.items():
+                store.entries[key] = entry
+                store.entries.move_to_end(key)
+            while len(store.entries) > self._max_entries:
+                store.entries.popitem(last=False)
+
+    def _delete_local(self, keys):
+        store = self._store
+        with store.lock:
+            for key in keys:
+                store.entries.pop(key, None)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if self._is_local(key):
+            self._delete_local([self._local_key(key, version)])
+        return added
+
+    def get(self, key, default=None, version=None):
+        if not self._is_local(key):
+            return self.shared.get(key, default, version)
+        self._sync()
+        local_key = self._local_key(key, version)
+        value = self._get_local(local_key)
+        if value is _MISSING:
+            value = self.shared.get(key, _MISSING, version)
+            if value is _MISSING:
+                return default
+            self._set_local({local_key: value})
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        values = {}
+        missing = []
+        for key in keys:
+            value = _MISSING
+            if self._is_local(key):
+                value = self._get_local(self._local_key(key, version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                values[key] = value
+        if missing:
+            fetched = self.shared.get_many(missing, version)
+            self._set_local({
+                self._local_key(key, version): value
+                for key, value in fetched.items() if self._is_local(key)
+            })
+            values.update(fetched)
+        return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        self._set_local({
+            self._local_key(key, version): value
+            for key, value in data.items()
+            if self._is_local(key) and key not in failed
+        }, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version)
+        if self._is_local(key):
+            self._delete_local([self._local_key(key, version)])
+        return value
+
+    def has_key(self, key, version=None):
+        return self.shared.has_key(key, version)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version)
+        self._delete_local([self._local_key(key, version)
+                            for key in keys if self._is_local(key)])
+
+    def clear(self):
+        self.shared.clear()
+        self.clear_local()
+
+    def clear_local(self):
+        """Сбрасывает локальные копии в этом и во всех других процессах."""
+        with self._store.lock:
+            self._store.entries.clear()
+        path = self._invalidation_file
+        if path is None:
+            return
+        descriptor = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                             0o644)
+        try:
+            # Запись с O_APPEND атомарна: размер файла меняется
+            # при каждом сбросе, даже одновременном.
+            os.write(descriptor, b'.')
+            if os.fstat(descriptor).st_size > INVALIDATION_FILE_LIMIT:
+                os.ftruncate(descriptor, 0)
+        finally:
+            os.close(descriptor)
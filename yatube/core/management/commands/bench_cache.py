@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core.cache import bump_generations
+
+LOCMEM = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+SQLITE = {'BACKEND': 'core.cache_backends.SQLiteCache'}
+
+
+def _backends(directory):
+    """Настройки CACHES для каждого сравниваемого варианта."""
+    sqlite = dict(SQLITE, LOCATION=os.path.join(directory, 'sqlite'))
+    shared = dict(SQLITE, LOCATION=os.path.join(directory, 'two-tier'))
+    return {
+        'locmem': {'default': LOCMEM},
+        'sqlite': {'default': sqlite},
+        'two-tier': {
+            'default': {
+                'BACKEND': 'core.cache_backends.TwoTierCache',
+                'LOCATION': 'shared',
+                'OPTIONS': {
+                    'LOCAL_PREFIXES': ['generation:', 'page:',
+                                       'template.cache.', 'post_card:'],
+                    'INVALIDATION_FILE': os.path.join(directory,
+                                                      'invalidate'),
+                },
+            },
+            'shared': shared,
+        },
+    }
+
+
+def _worker(config, url, requests, bump_every, start_event, results):
+    with override_settings(CACHES=config):
+        client = Client()
+        renders = 0
+        start_event.wait()
+        started = time.perf_counter()
+        for num in range(1, requests + 1):
+            if bump_every and num % bump_every == 0:
+                # Как будто появился новый пост.
+                bump_generations('index')
+            # Страница из кеша не обращается к базе.
+            with CaptureQueriesContext(connection) as queries:
+                client.get(url)
+            renders += bool(queries)
+        results.put((time.perf_counter() - started, renders))
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает кеши LocMem, SQLite и двухуровневый: N процессов '
+            'одновременно запрашивают страницу.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на процесс.')
+        parser.add_argument('--url', default='/')
+        parser.add_argument('--bump-every', type=int, default=0,
+                            help='Сбрасывать поколение index каждые '
+                                 'N запросов процесса.')
+
+    def handle(self, *args, processes, requests, url, bump_every,
+               **options):
+        context = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as directory:
+            for name, config in _backends(directory).items():
+                # Соединения с базой нельзя делить между процессами.
+                connections.close_all()
+                start_event = context.Event()
+                results = context.Queue()
+                workers = [
+                    context.Process(
+                        target=_worker,
+                        args=(config, url, requests, bump_every,
+                              start_event, results))
+                    for _ in range(processes)
+                ]
+                for worker in workers:
+                    worker.start()
+                started = time.perf_counter()
+                start_event.set()
+                timings, renders = zip(*(results.get() for _ in workers))
+                elapsed = time.perf_counter() - started
+                for worker in workers:
+                    worker.join()
+                total = processes * requests
+                self.stdout.write(
+                    f'{name}: {total} запросов за {elapsed:.2f} с, '
+                    f'{total / elapsed:.0f} запросов/с, '
+                    f'медленнейший процесс {max(timings):.2f} с, '
+                    f'перерисовок страницы {sum(renders)}')
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+DIGEST = re.compile('[0-9a-f]{64}')
+
+
+def content_hash(content):
+    """SHA-256 файла, прочитанного по кускам: в памяти не весь файл."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла - хеш содержимого:
+    <каталог upload_to>/<2 символа хеша>/<хеш>.<расширение>.
+
+    Одинаковые файлы хранятся один раз: если файл с таким
+    содержимым уже есть, повторно он не записывается, а save()
+    возвращает имя существующего. Поэтому и миниатюры sorl,
+    которые строятся по имени исходника, создаются один раз.
+    """
+
+    @staticmethod
+    def content_name(name, digest):
+        """Имя по содержимому для файла, загружаемого как name."""
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    @staticmethod
+    def is_content_name(name):
+        directory, filename = os.path.split(name)
+        digest = os.path.splitext(filename)[0]
+        return (DIGEST.fullmatch(digest) is not None
+                and os.path.basename(directory) == digest[:2])
+
+    def _save(self, name, content):
+        # Storage.save уже подобрал свободное имя для исходного,
+        # но от него нужны только каталог и расширение.
+        return self.save_content(
+            self.content_name(name, content_hash(content)), content)
+
+    def save_content(self, name, content):
+        """Сохраняет файл под уже посчитанным именем по содержимому,
+        если такого файла ещё нет. У существующего обновляется время
+        изменения: сборщик мусора не удаляет свежие файлы, а этот
+        сейчас получит новую ссылку.
+        """
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import (LOCK_KEY, bump_generations, generation_key,
+                        single_flight)
+
+
+@override_settings(CACHE_LOCK_TIMEOUT=2, CACHE_LOCK_POLL=0.01)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='fresh', delay=0):
+        def inner():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return inner
+
+    def test_concurrent_misses_compute_once(self):
+        """Одновременные промахи пересчитывают значение один раз."""
+        results = []
+
+        def worker():
+            results.append(
+                single_flight('key', self.compute(delay=0.2), 60))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['fresh'] * 8)
+
+    def test_stale_value_served_while_refreshing(self):
+        """Пока один процесс обновляет значение, остальные
+        получают устаревшее, а не пересчитывают его.
+        """
+        cache.set('key', ('stale', time.time() - 1), 60)
+        cache.add(LOCK_KEY.format('key'), 1)
+        self.assertEqual(single_flight('key', self.compute(), 60), 'stale')
+        self.assertEqual(self.calls, 0)
+        cache.delete(LOCK_KEY.format('key'))
+        self.assertEqual(single_flight('key', self.compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(single_flight('key', self.compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+    def test_uncacheable_value_not_stored(self):
+        """Значение, не прошедшее cacheable, не сохраняется."""
+        for _ in range(2):
+            single_flight('key', self.compute(), 60,
+                          cacheable=lambda value: False)
+        self.assertEqual(self.calls, 2)
+
+    def test_generation_bump_changes_key(self):
+        """bump_generations меняет ключ для своего имени."""
+        before = generation_key(['group:test', 'index'])
+        self.assertEqual(before, generation_key(['group:test', 'index']))
+        bump_generations('group:test')
+        self.assertNotEqual(before, generation_key(['group:test', 'index']))
+
+    def test_single_flight_cache_tag(self):
+        """Тег single_flight_cache кеширует фрагмент по vary_on."""
+        template = Template(
+            '{% load single_flight %}'
+            '{% single_flight_cache 60 fragment name %}'
+            '{{ value }}'
+            '{% endsingle_flight_cache %}')
+        self.assertEqual(
+            template.render(Context({'name': 'a', 'value': 1})), '1')
+        self.assertEqual(
+            template.render(Context({'name': 'a', 'value': 2})), '1')
+        self.assertEqual(
+            template.render(Context({'name': 'b', 'value': 3})), '3')
@@ -0,0 +1,191 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import _generation_key, bump_generations, get_generations
+from core.cache_backends import SQLiteCache, TwoTierCache, _LocalStore
+
+
+def _increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {
+            'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 5},
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_get_set_many(self):
+        """set_many/get_many сохраняют и читают любые значения."""
+        data = {'int': 1, 'text': 'текст', 'list': [1, 2], 'none': None}
+        self.cache.set_many(data)
+        self.assertEqual(self.cache.get_many([*data, 'missing']), data)
+        self.cache.delete_many(['int', 'text'])
+        self.assertEqual(self.cache.get_many(['int', 'list']),
+                         {'list': [1, 2]})
+
+    def test_add_and_expiry(self):
+        """add не перезаписывает живой ключ, но занимает просроченный."""
+        self.assertTrue(self.cache.add('key', 'first', 60))
+        self.assertFalse(self.cache.add('key', 'second', 60))
+        self.assertEqual(self.cache.get('key'), 'first')
+        self.cache.set('key', 'old', 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new', 60))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr(self):
+        """incr работает и для INTEGER, и для значений через pickle."""
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.cache.set('big', 2 ** 70)
+        self.assertEqual(self.cache.incr('big'), 2 ** 70 + 1)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_incr_is_atomic_across_processes(self):
+        """Процессы, разделяющие файл, не теряют инкременты."""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_increment,
+                                   args=(self.location, 100))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 400)
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняются давно прочитанные ключи."""
+        self.cache.ACCESS_RESOLUTION = 0
+        for num in range(10):
+            self.cache.set(f'key{num}', num)
+            time.sleep(0.001)
+        self.cache.get('key0')
+        self.cache.set('key10', 10)
+        self.assertEqual(self.cache.get('key0'), 0)
+        self.assertIsNone(self.cache.get('key1'))
+        self.assertIsNone(self.cache.get('key2'))
+        self.assertEqual(self.cache.get('key10'), 10)
+        self.assertLessEqual(len(self.cache.get_many(
+            [f'key{num}' for num in range(11)])), 10)
+
+    def test_count_checked_every_interval(self):
+        """COUNT(*) выполняется раз в CULL_CHECK_INTERVAL записей,
+        а не на каждой.
+        """
+        cache = SQLiteCache(self.location, {
+            'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_CHECK_INTERVAL': 5},
+        })
+        counts = []
+        cache._connection.set_trace_callback(
+            lambda sql: counts.append(sql) if 'COUNT(*)' in sql else None)
+        for num in range(9):
+            cache.set(f'key{num}', num)
+        cache.add('added', 1)
+        self.assertEqual(len(counts), 2)
+        for num in range(10):
+            cache.set(f'more{num}', num)
+        self.assertLessEqual(len(cache.get_many(
+            [*(f'key{num}' for num in range(9)), 'added',
+             *(f'more{num}' for num in range(10))])), 10)
+
+    def test_default_interval(self):
+        self.assertEqual(self.cache._cull_interval, 1)
+        cache = SQLiteCache(self.location, {
+            'OPTIONS': {'MAX_ENTRIES': 50000}})
+        self.assertEqual(cache._cull_interval, 500)
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.invalidation_file = os.path.join(self.directory, 'invalidate')
+        self.config = {
+            'default': {
+                'BACKEND': 'core.cache_backends.TwoTierCache',
+                'LOCATION': 'shared',
+                'OPTIONS': {
+                    'MAX_ENTRIES': 3,
+                    'LOCAL_PREFIXES': ['page:', 'generation:'],
+                    'INVALIDATION_FILE': self.invalidation_file,
+                },
+            },
+            'shared': {
+                'BACKEND': 'core.cache_backends.SQLiteCache',
+                'LOCATION': os.path.join(self.directory, 'cache.sqlite3'),
+            },
+        }
+        settings = override_settings(CACHES=self.config)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.cache = self.make_worker()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_worker(self):
+        """Кеш отдельного процесса: со своими локальными копиями."""
+        worker = TwoTierCache('shared', self.config['default'])
+        worker._store = _LocalStore()
+        return worker
+
+    def test_hot_keys_served_from_memory(self):
+        """Ключи с LOCAL_PREFIXES читаются из памяти, остальные - нет."""
+        self.cache.set_many({'page:1': 'page', 'other': 'value'})
+        caches['shared'].set_many({'page:1': 'changed', 'other': 'changed'})
+        self.assertEqual(self.cache.get('page:1'), 'page')
+        self.assertEqual(self.cache.get_many(['page:1', 'other']),
+                         {'page:1': 'page', 'other': 'changed'})
+
+    def test_local_copies_are_bounded(self):
+        """В памяти не больше MAX_ENTRIES ключей, вытесняются старые."""
+        self.cache.set_many({f'page:{num}': num for num in range(4)})
+        caches['shared'].set_many({f'page:{num}': -1 for num in range(4)})
+        self.assertEqual(self.cache.get('page:0'), -1)
+        self.assertEqual(self.cache.get('page:3'), 3)
+
+    def test_clear_local_reaches_other_processes(self):
+        """clear_local() в одном процессе сбрасывает копии в других."""
+        other = self.make_worker()
+        self.cache.set('page:1', 'old')
+        self.assertEqual(other.get('page:1'), 'old')
+        caches['shared'].set('page:1', 'new')
+        self.assertEqual(other.get('page:1'), 'old')
+        self.cache.clear_local()
+        self.assertEqual(other.get('page:1'), 'new')
+
+    def test_writes_go_through(self):
+        """add, incr и delete меняют общий кеш и локальную копию."""
+        other = self.make_worker()
+        self.assertTrue(self.cache.add('page:1', 1))
+        self.assertFalse(other.add('page:1', 2))
+        self.assertEqual(other.get('page:1'), 1)
+        self.assertEqual(self.cache.incr('page:1'), 2)
+        self.assertEqual(self.cache.get('page:1'), 2)
+        self.cache.delete('page:1')
+        self.assertIsNone(self.cache.get('page:1'))
+
+    def test_bump_generations_clears_local_copies(self):
+        """Сдвиг поколения виден процессу, который держал старое."""
+        other = self.make_worker()
+        key = _generation_key('index')
+        get_generations(['index'])
+        before = other.get(key)
+        bump_generations('index')
+        self.assertEqual(other.get(key), before + 1)
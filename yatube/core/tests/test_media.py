@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from core.views import byte_range
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CONTENT = bytes(range(256)) * 40
+HASHED = 'posts/ab/' + 'ab' * 32 + '.png'
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, MEDIA_SENDFILE=None)
+class ServeMediaTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ('posts/old.png', 'cache/00/11/thumb.jpg', HASHED):
+            path = os.path.join(TEMP_MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get(self, name='posts/old.png', **headers):
+        return self.client.get('/media/' + name, **headers)
+
+    def test_full_file(self):
+        """Файл отдаётся целиком с длиной, типом и ETag."""
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'])
+
+    def test_cache_headers(self):
+        """Миниатюры и файлы с именем по содержимому кешируются
+        навсегда, остальное - на MEDIA_CACHE_TIMEOUT.
+        """
+        for name in ('cache/00/11/thumb.jpg', HASHED):
+            with self.subTest(name=name):
+                self.assertEqual(
+                    self.get(name)['Cache-Control'],
+                    f'public, max-age={settings.MEDIA_IMMUTABLE_TIMEOUT}, '
+                    'immutable')
+        self.assertEqual(
+            self.get()['Cache-Control'],
+            f'public, max-age={settings.MEDIA_CACHE_TIMEOUT}')
+
+    def test_if_none_match(self):
+        """Совпавший If-None-Match даёт 304 без тела."""
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code,
+                         200)
+
+    def test_range(self):
+        """Range отдаёт кусок файла с Content-Range."""
+        cases = (
+            ('bytes=10-19', 10, 19),
+            ('bytes=10000-', 10000, len(CONTENT) - 1),
+            ('bytes=-5', len(CONTENT) - 5, len(CONTENT) - 1),
+            ('bytes=100-999999', 100, len(CONTENT) - 1),
+        )
+        for header, start, end in cases:
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b''.join(response.streaming_content),
+                                 CONTENT[start:end + 1])
+                self.assertEqual(response['Content-Range'],
+                                 f'bytes {start}-{end}/{len(CONTENT)}')
+                self.assertEqual(response['Content-Length'],
+                                 str(end - start + 1))
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE=f'bytes={len(CONTENT)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'],
+                         f'bytes */{len(CONTENT)}')
+
+    def test_if_range(self):
+        """Range с устаревшим If-Range отдаёт файл целиком."""
+        etag = self.get()['ETag']
+        self.assertEqual(
+            self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code,
+            206)
+        self.assertEqual(
+            self.get(HTTP_RANGE='bytes=0-9',
+                     HTTP_IF_RANGE='"stale"').status_code,
+            200)
+
+    @override_settings(MEDIA_SENDFILE='X-Accel-Redirect')
+    def test_x_accel_redirect(self):
+        response = self.get()
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/posts/old.png')
+        self.assertIn('ETag', response)
+
+    @override_settings(MEDIA_SENDFILE='X-Sendfile')
+    def test_x_sendfile(self):
+        response = self.get()
+        self.assertEqual(response['X-Sendfile'],
+                         os.path.join(TEMP_MEDIA_ROOT, 'posts/old.png'))
+
+    def test_not_found(self):
+        for name in ('posts/missing.png', 'posts', '../settings.py',
+                     'posts/../../manage.py'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code, 404)
+
+    def test_byte_range_ignores_unsupported(self):
+        """Несколько диапазонов и ошибки синтаксиса - весь файл."""
+        for header in ('', 'bytes=0-1,5-6', 'items=0-1', 'bytes=5-1',
+                       'bytes=-'):
+            with self.subTest(header=header):
+                self.assertIsNone(byte_range(header, 100))
@@ -1,4 +1,20 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_etags, urlquote
+from django.views.decorators.http import require_safe
+
+from .storage import ContentAddressedStorage
+
+RANGE = re.compile(r'bytes=(\d*)-(\d*)')
 
 
 def page_not_found(request, exception):
@@ -13,3 +29,125 @@ def permission_denied(request, reason=''):
 
 def server_error(request):
     return render(request, 'core/500.html', status=500)
+
+
+class FileRange:
+    """Кусок файла [start, end] для FileResponse: отдаётся блоками
+    и закрывает файл вместе с ответом.
+    """
+
+    def __init__(self, file, start, end):
+        file.seek(start)
+        self.file = file
+        self.remaining = end - start + 1
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def byte_range(header, size):
+    """(start, end) из заголовка Range с одним диапазоном.
+    None - заголовка нет или он не понят: отдаётся весь файл;
+    ValueError - диапазон за концом файла.
+    """
+    match = RANGE.fullmatch(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        suffix = int(last)
+        if not suffix:
+            raise ValueError(header)
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def media_cache_timeout(path):
+    """Файлы, которые не меняются под тем же именем (миниатюры,
+    варианты, картинки с именем по содержимому), кешируются навсегда.
+    """
+    if (path.startswith(settings.MEDIA_IMMUTABLE_PREFIXES)
+            or ContentAddressedStorage.is_content_name(path)):
+        return settings.MEDIA_IMMUTABLE_TIMEOUT
+    return None
+
+
+@require_safe
+def serve_media(request, path):
+    """Отдаёт файл из MEDIA_ROOT: через фронтовый сервер, если задан
+    MEDIA_SENDFILE, иначе сам, с If-None-Match и Range.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404(path)
+    if not os.path.isfile(full_path):
+        raise Http404(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = _media_response(request, path, full_path, stat.st_size,
+                                   etag)
+    if response.status_code in (200, 206, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        timeout = media_cache_timeout(path)
+        if timeout:
+            patch_cache_control(response, public=True, max_age=timeout,
+                                immutable=True)
+        else:
+            patch_cache_control(response, public=True,
+                                max_age=settings.MEDIA_CACHE_TIMEOUT)
+    return response
+
+
+def _media_response(request, path, full_path, size, etag):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    if settings.MEDIA_SENDFILE:
+        # Range и отдачу файла берёт на себя фронтовый сервер.
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_SENDFILE == 'X-Accel-Redirect':
+            response['X-Accel-Redirect'] = (
+                settings.MEDIA_ACCEL_REDIRECT_PREFIX + urlquote(path))
+        else:
+            response[settings.MEDIA_SENDFILE] = full_path
+        return response
+    try:
+        requested = byte_range(request.META.get('HTTP_RANGE', ''), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and etag not in parse_etags(if_range):
+        requested = None
+    file = open(full_path, 'rb')
+    if requested is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = requested
+        response = FileResponse(FileRange(file, start, end), status=206,
+                                content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
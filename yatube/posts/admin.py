@@ -1,11 +1,107 @@
+import datetime
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.cache import cache
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from core.cache import generation_key
 
-from .models import Post
+from . import counts, search
+from .models import Post, PostQuerySet
+from .paginators import WindowedPaginator
 
 from .models import Group, Comment, Follow
 
+GROUP_CHOICES_KEY = 'admin:group_choices:{}'
+
+
+def group_choices():
+    """Варианты для select группы: один список из кеша на все строки
+    списка постов вместо запроса групп на каждую строку.
+    """
+    key = GROUP_CHOICES_KEY.format(generation_key(['groups']))
+    choices = cache.get(key)
+    if choices is None:
+        choices = [('', '---------'),
+                   *Group.objects.order_by('title').values_list('pk', 'title')]
+        cache.set(key, choices, settings.POSTS_PAGE_CACHE_TIMEOUT)
+    return choices
+
+
+def _next_period(date, kind):
+    if kind == 'year':
+        return date.replace(year=date.year + 1, month=1, day=1)
+    if kind == 'month':
+        if date.month == 12:
+            return date.replace(year=date.year + 1, month=1, day=1)
+        return date.replace(month=date.month + 1, day=1)
+    return date + datetime.timedelta(days=1)
+
+
+class IndexedDatesQuerySet(PostQuerySet):
+    """dates() для навигации по датам в админке: вместо SELECT DISTINCT
+    по всем постам - по одному поиску MIN(pub_date) >= начала следующего
+    периода на каждый год, месяц или день, то есть по индексу
+    post_pub_date.
+    """
+
+    def dates(self, field_name, kind, order='ASC'):
+        posts = self.order_by()
+        dates = []
+        first = posts.aggregate(first=Min(field_name))['first']
+        while first is not None:
+            date = timezone.localtime(first).date()
+            if kind in ('year', 'month'):
+                date = date.replace(day=1)
+            if kind == 'year':
+                date = date.replace(month=1)
+            dates.append(date)
+            start = timezone.make_aware(datetime.datetime.combine(
+                _next_period(date, kind), datetime.time.min))
+            first = posts.filter(**{f'{field_name}__gte': start}).aggregate(
+                first=Min(field_name))['first']
+        if order == 'DESC':
+            dates.reverse()
+        return dates
+
+
+class EstimatedCountAdmin(admin.ModelAdmin):
+    """Список без точного COUNT(*) по всей таблице: без фильтров число
+    записей берётся из estimated_count(), с фильтрами считается не
+    дальше POSTS_ADMIN_COUNT_LIMIT или конца открытой страницы.
+    """
+    show_full_result_count = False
+
+    def estimated_count(self):
+        """Оценка сверху по наибольшему pk - одно чтение индекса
+        первичного ключа. Удалённые записи её не уменьшают: последние
+        страницы могут оказаться пустыми, но недоступных записей нет.
+        """
+        return self.model._default_manager.aggregate(
+            count=Max('pk'))['count'] or 0
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        count = None if queryset.query.where else self.estimated_count()
+        if count is None:
+            # Страницы за пределом тоже открываются: счёт доходит
+            # до конца открытой страницы и ещё одной записи, чтобы
+            # была видна следующая.
+            try:
+                page = max(int(request.GET.get(PAGE_VAR, 0)), 0)
+            except ValueError:
+                page = 0
+            limit = max(settings.POSTS_ADMIN_COUNT_LIMIT,
+                        (page + 1) * per_page + 1)
+            count = queryset.order_by()[:limit].count()
+        return WindowedPaginator(queryset, per_page, orphans,
+                                 allow_empty_first_page, count=count)
 
-class PostAdmin(admin.ModelAdmin):
+
+class PostAdmin(EstimatedCountAdmin):
     list_display = (
         'pk',
         'text',
@@ -14,15 +110,63 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    raw_id_fields = ('author',)
     search_fields = ('text',)
+    # Фильтр по дате - готовые диапазоны, запросов к таблице не делает.
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    empty_value_display = '-пусто-'
+
+    def get_queryset(self, request):
+        posts = super().get_queryset(request)
+        return IndexedDatesQuerySet(posts.model, query=posts.query,
+                                    using=posts.db)
+
+    def estimated_count(self):
+        return counts.all_post_count()
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'group':
+            field.choices = group_choices()
+        return field
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по индексу FTS5 вместо LIKE '%...%' по всей таблице."""
+        if not search.available() or not search.to_match(search_term):
+            return super().get_search_results(request, queryset,
+                                              search_term)
+        return search.filter_posts(queryset, search_term), False
+
+
+class CommentAdmin(EstimatedCountAdmin):
+    list_display = ('pk', 'text', 'pub_date', 'author', 'post')
+    list_select_related = ('author', 'post')
+    raw_id_fields = ('post', 'author')
+    search_fields = ('text',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по индексу FTS5, как у постов."""
+        if not search.available() or not search.to_match(search_term):
+            return super().get_search_results(request, queryset,
+                                              search_term)
+        return search.filter_comments(queryset, search_term), False
+
+
+class FollowAdmin(EstimatedCountAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    raw_id_fields = ('user', 'author')
+    # Точное совпадение имени ищется по уникальному индексу username.
+    search_fields = ('=user__username', '=author__username')
+
 
 admin.site.register(Post, PostAdmin)
 
 admin.site.register(Group)
 
-admin.site.register(Comment)
+admin.site.register(Comment, CommentAdmin)
 
-admin.site.register(Follow)
+admin.site.register(Follow, FollowAdmin)
@@ -0,0 +1,171 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from . import timeline
+from .models import (Comment, Counter, Follow, Post, StoredImage,
+                     TimelineEntry)
+
+COUNT_KEY = 'posts_count:{scope}:{pk}'
+
+
+def count_key(scope, pk=0):
+    return COUNT_KEY.format(scope=scope, pk=pk)
+
+
+def increment(scope, object_id=0, delta=1):
+    """Атомарно меняет счётчик на delta и сбрасывает его кеш.
+    Строка счётчика создаётся только при увеличении.
+    """
+    counters = Counter.objects.filter(scope=scope, object_id=object_id)
+    if not counters.update(value=F('value') + delta) and delta > 0:
+        try:
+            with transaction.atomic():
+                Counter.objects.create(scope=scope, object_id=object_id,
+                                       value=delta)
+        except IntegrityError:
+            counters.update(value=F('value') + delta)
+    cache.delete(count_key(scope, object_id))
+
+
+def image_reference(name, delta):
+    """Меняет число постов, ссылающихся на файл картинки name.
+    Посты, созданные без сигналов (bulk_create), не учтены:
+    счётчик не уходит ниже нуля.
+    """
+    if not name:
+        return
+    images = StoredImage.objects.filter(name=name, refs__gte=-delta)
+    if not images.update(refs=F('refs') + delta) and delta > 0:
+        try:
+            with transaction.atomic():
+                StoredImage.objects.create(name=name, refs=delta)
+        except IntegrityError:
+            images.update(refs=F('refs') + delta)
+
+
+def drop(scope, object_id):
+    """Удаляет счётчик удалённого объекта."""
+    Counter.objects.filter(scope=scope, object_id=object_id).delete()
+    cache.delete(count_key(scope, object_id))
+
+
+def actual_counts(scope):
+    """Настоящие значения счётчиков scope, посчитанные GROUP BY."""
+    if scope == Counter.ALL_POSTS:
+        return {0: Post.objects.count()}
+    if scope == Counter.POPULAR_AUTHOR:
+        # Отметка не снимается (posts.timeline), поэтому к авторам,
+        # популярным сейчас, добавляются отмеченные раньше.
+        flagged = Counter.objects.filter(scope=scope).values_list(
+            'object_id', flat=True)
+        popular = (Follow.objects.order_by().values_list('author_id')
+                   .annotate(followers=Count('pk'))
+                   .filter(followers__gt=settings.TIMELINE_FANOUT_LIMIT)
+                   .values_list('author_id', flat=True))
+        return dict.fromkeys({*flagged, *popular}, 1)
+    querysets = {
+        Counter.GROUP_POSTS: (Post.objects.exclude(group=None), 'group_id'),
+        Counter.USER_POSTS: (Post.objects.all(), 'author_id'),
+        Counter.USER_FOLLOWERS: (Follow.objects.all(), 'author_id'),
+        Counter.USER_FOLLOWING: (Follow.objects.all(), 'user_id'),
+        Counter.POST_COMMENTS: (Comment.objects.all(), 'post_id'),
+    }
+    queryset, field = querysets[scope]
+    return dict(queryset.order_by().values_list(field)
+                .annotate(Count('pk')).iterator())
+
+
+def _counter_values(pairs):
+    """Значения счётчиков (scope, object_id) из кеша;
+    промахи одним запросом к Counter.
+    """
+    keys = {count_key(scope, pk): (scope, pk) for scope, pk in pairs}
+    cached = cache.get_many(keys)
+    values = {keys[key]: value for key, value in cached.items()}
+    missing = [pair for pair in keys.values() if pair not in values]
+    if missing:
+        fresh = dict.fromkeys(missing, 0)
+        rows = Counter.objects.filter(
+            scope__in={scope for scope, _ in missing},
+            object_id__in={pk for _, pk in missing},
+        ).values_list('scope', 'object_id', 'value')
+        for scope, pk, value in rows:
+            if (scope, pk) in fresh:
+                fresh[scope, pk] = value
+        cache.set_many(
+            {count_key(*pair): value for pair, value in fresh.items()},
+            settings.POSTS_COUNT_TIMEOUT)
+        values.update(fresh)
+    return values
+
+
+def counter_values(scope, object_ids):
+    values = _counter_values((scope, pk) for pk in object_ids)
+    return {pk: values[scope, pk] for pk in object_ids}
+
+
+def counter_value(scope, object_id=0):
+    return counter_values(scope, [object_id])[object_id]
+
+
+def all_post_count():
+    """Число всех постов для главной страницы."""
+    return counter_value(Counter.ALL_POSTS)
+
+
+def group_post_count(group):
+    """Число постов группы."""
+    return counter_value(Counter.GROUP_POSTS, group.pk)
+
+
+def author_post_counts(author_ids):
+    """Число постов каждого автора одним get_many."""
+    return counter_values(Counter.USER_POSTS, author_ids)
+
+
+def author_post_count(author):
+    """Число постов автора."""
+    return counter_value(Counter.USER_POSTS, author.pk)
+
+
+def follower_counts(author_ids):
+    """Число подписчиков каждого автора и его отметка
+    Counter.POPULAR_AUTHOR одним get_many.
+    """
+    scopes = (Counter.USER_FOLLOWERS, Counter.POPULAR_AUTHOR)
+    values = _counter_values(
+        (scope, pk) for pk in author_ids for scope in scopes)
+    return {pk: tuple(values[scope, pk] for scope in scopes)
+            for pk in author_ids}
+
+
+def follow_post_count(user, popular_ids=None):
+    """Число постов в ленте подписок (timeline.follow_feed): записи
+    TimelineEntry пользователя - при подписке туда попадают только
+    TIMELINE_BACKFILL последних постов автора - и счётчики популярных
+    авторов, чьи посты подмешиваются при чтении.
+    """
+    if popular_ids is None:
+        popular_ids = timeline.followed_popular_ids(user)
+    entries = TimelineEntry.objects.filter(user=user)
+    if popular_ids:
+        entries = entries.exclude(post__author_id__in=popular_ids)
+    return entries.count() + sum(author_post_counts(popular_ids).values())
+
+
+def user_counts(user):
+    """Число постов, подписчиков и подписок пользователя."""
+    scopes = (Counter.USER_POSTS, Counter.USER_FOLLOWERS,
+              Counter.USER_FOLLOWING)
+    values = _counter_values((scope, user.pk) for scope in scopes)
+    return tuple(values[scope, user.pk] for scope in scopes)
+
+
+def post_counts(post_id, author_id):
+    """Число комментариев к посту и постов его автора одним get_many."""
+    values = _counter_values([(Counter.POST_COMMENTS, post_id),
+                              (Counter.USER_POSTS, author_id)])
+    return (values[Counter.POST_COMMENTS, post_id],
+            values[Counter.USER_POSTS, author_id])
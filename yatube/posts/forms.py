@@ -1,8 +1,42 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from .image_variants import describe_image, drop_variants
+from .uploads import check_size, prepare_image
 from .models import Post, Comment
 
+NO_IMAGE = {'image_width': None, 'image_height': None, 'image_size': None,
+            'image_placeholder': ''}
+
 
 class PostForm(forms.ModelForm):
+    def clean_image(self):
+        """Новая картинка проверяется по заголовку и при необходимости
+        уменьшается (posts.uploads), прежняя остаётся как есть.
+        """
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            check_size(image)
+            image = prepare_image(image)
+        return image
+
+    def save(self, commit=True):
+        """Запоминает размеры и заглушку новой картинки один раз,
+        чтобы шаблоны не открывали файл. Варианты прежней картинки
+        удаляются: до появления новых карточка покажет миниатюру.
+        """
+        post = super().save(commit=False)
+        if 'image' in self.changed_data:
+            image = self.cleaned_data['image']
+            for field, value in (describe_image(image) if image
+                                 else NO_IMAGE).items():
+                setattr(post, field, value)
+        if commit:
+            if 'image' in self.changed_data and post.pk:
+                drop_variants(post)
+            post.save()
+            self.save_m2m()
+        return post
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
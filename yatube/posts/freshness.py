@@ -0,0 +1,65 @@
+"""Дешёвые признаки свежести страниц для core.cache.conditional_page.
+
+Каждая функция делает один запрос по индексу (счётчики и поколения -
+из кеша) и возвращает (last_modified, token). В token входят время
+самого ресурса и поколения закешированных страниц (core.cache): их
+сдвигают комментарии, подписки, правки постов, имена авторов
+и названия групп. Last-Modified - самое позднее из времени ресурса
+и времени сдвига этих поколений, поэтому он растёт при любом
+изменении страницы, в том числе при удалении последнего поста.
+"""
+from core.cache import generation_key, last_changed
+
+from . import counts
+from .models import Post
+
+
+def freshness(resource_time, names, *parts):
+    """(last_modified, token) для ресурса со временем resource_time,
+    страница которого зависит от поколений names.
+    """
+    times = [last_changed(names)]
+    if resource_time is not None:
+        times.append(resource_time.timestamp())
+    token = ':'.join((str(resource_time), *map(str, parts),
+                      generation_key(names)))
+    return max(times), token
+
+
+def latest_post_date(posts):
+    """Дата последнего поста из posts или None."""
+    return (posts.order_by('-pub_date')
+            .values_list('pub_date', flat=True).first())
+
+
+def post_freshness(post_id):
+    """Время изменения поста, число комментариев к нему и постов
+    автора и поколения карточек поста, автора, группы и профиля
+    (в нём же учтено число постов автора).
+    """
+    row = (Post.objects.filter(pk=post_id)
+           .values_list('updated', 'author_id', 'author__username',
+                        'group_id').first())
+    if row is None:
+        # Ответит 404 сам view.
+        return None, 'missing'
+    updated, author_id, username, group_id = row
+    comment_count, author_posts = counts.post_counts(post_id, author_id)
+    names = [f'card:post:{post_id}', f'card:user:{author_id}',
+             f'profile:{username}']
+    if group_id:
+        names.append(f'card:group:{group_id}')
+    return freshness(updated, names, comment_count, author_posts)
+
+
+def profile_freshness(username):
+    """Последний пост автора и поколение его профиля."""
+    return freshness(
+        latest_post_date(Post.objects.filter(author__username=username)),
+        [f'profile:{username}'])
+
+
+def group_freshness(slug):
+    """Последний пост группы и поколение её страницы."""
+    return freshness(latest_post_date(Post.objects.filter(group__slug=slug)),
+                     [f'group:{slug}'])
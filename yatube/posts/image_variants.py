@@ -0,0 +1,139 @@
+import base64
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import PostImageVariant
+
+MIME_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp',
+              'JPEG': 'image/jpeg'}
+EXTENSIONS = {'AVIF': 'avif', 'WEBP': 'webp', 'JPEG': 'jpg'}
+
+# Ширина размытой заглушки: PNG 16x6 занимает в base64 около 500 байт.
+PLACEHOLDER_WIDTH = 16
+# Значения тега EXIF Orientation, при которых картинка повёрнута на 90°.
+ROTATED = (5, 6, 7, 8)
+EXIF_ORIENTATION = 0x0112
+
+
+def available_formats():
+    """Форматы из POSTS_IMAGE_FORMATS, которые умеет сохранять Pillow:
+    AVIF и WebP зависят от того, с чем он собран.
+    """
+    Image.init()
+    return [fmt for fmt in settings.POSTS_IMAGE_FORMATS if fmt in Image.SAVE]
+
+
+def variant_sizes(width):
+    """Размеры вариантов для картинки шириной width: больше исходной
+    не увеличиваем, пропорция как у карточки поста.
+    """
+    aspect_width, aspect_height = settings.POSTS_IMAGE_ASPECT
+    widths = [size for size in settings.POSTS_IMAGE_WIDTHS
+              if size <= width] or [width]
+    return [(size, round(size * aspect_height / aspect_width))
+            for size in widths]
+
+
+def encode(image, fmt):
+    """Картинка в формате fmt с качеством из POSTS_IMAGE_QUALITY."""
+    options = {'quality': settings.POSTS_IMAGE_QUALITY.get(fmt, 80)}
+    if fmt == 'JPEG':
+        image = image.convert('RGB')
+        options.update(optimize=True, progressive=True)
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands()
+                              or 'transparency' in image.info else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def describe_image(file):
+    """Поля Post о картинке: ширина и высота с учётом EXIF-поворота,
+    размер в байтах и размытая заглушка - крошечный PNG с пропорцией
+    карточки в виде data: URI.
+    """
+    file.seek(0)
+    image = Image.open(file)
+    width, height = image.size
+    if image.getexif().get(EXIF_ORIENTATION) in ROTATED:
+        width, height = height, width
+    # JPEG декодируется сразу в уменьшенном масштабе.
+    image.draft('RGB', (PLACEHOLDER_WIDTH * 8, PLACEHOLDER_WIDTH * 8))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    aspect_width, aspect_height = settings.POSTS_IMAGE_ASPECT
+    tiny = ImageOps.fit(image, (
+        PLACEHOLDER_WIDTH,
+        max(1, round(PLACEHOLDER_WIDTH * aspect_height / aspect_width)),
+    ), Image.BILINEAR)
+    buffer = BytesIO()
+    tiny.save(buffer, 'PNG', optimize=True)
+    file.seek(0)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_size': file.size,
+        'image_placeholder': 'data:image/png;base64,'
+                             + base64.b64encode(buffer.getvalue()).decode(),
+    }
+
+
+def _delete_unused_files(variants):
+    """Удаляет файлы вариантов, на которые больше не ссылается
+    ни один пост: посты с одинаковой картинкой делят файлы.
+    """
+    unused = {variant.image.name for variant in variants}
+    unused -= set(PostImageVariant.objects.filter(image__in=unused)
+                  .values_list('image', flat=True))
+    for variant in variants:
+        if variant.image.name in unused:
+            unused.discard(variant.image.name)
+            variant.image.delete(save=False)
+
+
+def drop_variants(post):
+    """Удаляет варианты картинки поста вместе с файлами, которые
+    больше никому не нужны.
+    """
+    old = list(post.image_variants.all())
+    post.image_variants.all().delete()
+    _delete_unused_files(old)
+
+
+def create_variants(post):
+    """Заменяет варианты картинки поста новыми: каждая ширина
+    из variant_sizes в каждом формате из available_formats.
+    Если у другого поста та же картинка, его варианты переиспользуются.
+    """
+    drop_variants(post)
+    if not post.image:
+        return []
+    shared = (PostImageVariant.objects
+              .filter(post__image=post.image.name)
+              .exclude(post=post)
+              .values_list('post_id', flat=True).first())
+    if shared is not None:
+        return PostImageVariant.objects.bulk_create(
+            PostImageVariant(post=post, format=variant.format,
+                             width=variant.width, height=variant.height,
+                             size=variant.size, image=variant.image.name)
+            for variant in PostImageVariant.objects.filter(post_id=shared))
+    with post.image.open('rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    stem = os.path.splitext(os.path.basename(post.image.name))[0]
+    variants = []
+    for width, height in variant_sizes(image.width):
+        resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for fmt in available_formats():
+            data = encode(resized, fmt)
+            variant = PostImageVariant(post=post, format=fmt, width=width,
+                                       height=height, size=len(data))
+            variant.image.save(f'{stem}-{width}.{EXTENSIONS[fmt]}',
+                               ContentFile(data), save=False)
+            variants.append(variant)
+    return PostImageVariant.objects.bulk_create(variants)
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Comment, Post, User
+
+
+def _create_thread(author, readers, comments_num):
+    post = Post.objects.create(author=author, text='Обсуждение')
+    Comment.objects.bulk_create(
+        Comment(post=post, author=readers[num % len(readers)],
+                text=f'Комментарий {num}')
+        for num in range(comments_num))
+    return post
+
+
+class Command(BaseCommand):
+    help = ('Меряет время страницы поста при разном числе комментариев: '
+            'оно не должно расти. Посты и комментарии создаются '
+            'в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--comments', type=int, nargs='+',
+                            default=[1, 2000, 20000])
+
+    def handle(self, *args, repeat, comments, **options):
+        client = Client()
+        with transaction.atomic():
+            author = User.objects.create_user(username='bench_author')
+            User.objects.bulk_create(
+                User(username=f'bench_reader{num}') for num in range(50))
+            readers = list(
+                User.objects.filter(username__startswith='bench_reader'))
+            baseline = None
+            for comments_num in comments:
+                post = _create_thread(author, readers, comments_num)
+                url = reverse('posts:post_detail', args=[post.pk])
+                client.get(url)
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    client.get(url)
+                elapsed = (time.perf_counter() - started) / repeat * 1000
+                baseline = baseline or elapsed
+                self.stdout.write(
+                    f'{comments_num:>7} комментариев: {elapsed:7.2f} мс, '
+                    f'{elapsed / baseline:4.1f}x от первого')
+            transaction.set_rollback(True)
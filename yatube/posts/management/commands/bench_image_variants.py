@@ -0,0 +1,96 @@
+import random
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw, ImageOps
+
+from posts.image_variants import available_formats, encode, variant_sizes
+
+# Сейчас всем отдаётся миниатюра sorl 960x339 в JPEG с его качеством.
+BASELINE_SIZE = (960, 339)
+BASELINE_QUALITY = 95
+
+
+def _sample(seed, size=(1600, 1000)):
+    """Похожая на фотографию картинка: градиенты, фигуры и шум."""
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize(size)
+    image = Image.merge('RGB', [
+        gradient.rotate(rng.randrange(360)).resize(size),
+        gradient.rotate(rng.randrange(360)).resize(size),
+        gradient.rotate(rng.randrange(360)).resize(size),
+    ])
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        radius = rng.randrange(20, 200)
+        draw.ellipse((x, y, x + radius, y + radius),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    noise = Image.effect_noise(size, 30).convert('RGB')
+    return Image.blend(image, noise, 0.15)
+
+
+def _baseline(image):
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=BASELINE_QUALITY)
+    return buffer.getvalue()
+
+
+def _timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает размер и время кодирования вариантов картинок '
+            'постов с нынешней миниатюрой 960x339 JPEG.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='Картинки; без них - сгенерированные.')
+        parser.add_argument('--samples', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--mbps', type=float, default=1.6,
+                            help='Скорость канала для оценки загрузки.')
+
+    def handle(self, *args, paths, samples, repeat, mbps, **options):
+        if paths:
+            images = [ImageOps.exif_transpose(Image.open(path))
+                      for path in paths]
+        else:
+            images = [_sample(seed) for seed in range(samples)]
+        results = {}
+        for image in images:
+            baseline = ImageOps.fit(image, BASELINE_SIZE, Image.LANCZOS)
+            data, elapsed = _timed(lambda: _baseline(baseline), repeat)
+            results.setdefault(('baseline', BASELINE_SIZE[0]), []).append(
+                (len(data), elapsed))
+            for width, height in variant_sizes(image.width):
+                resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+                for fmt in available_formats():
+                    data, elapsed = _timed(
+                        lambda: encode(resized, fmt), repeat)
+                    results.setdefault((fmt, width), []).append(
+                        (len(data), elapsed))
+        skipped = set(settings.POSTS_IMAGE_FORMATS) - set(available_formats())
+        if skipped:
+            self.stdout.write('Pillow не умеет сохранять: '
+                              + ', '.join(sorted(skipped)))
+        baseline_bytes = self._average(results['baseline', BASELINE_SIZE[0]])
+        self.stdout.write(f'{len(images)} картинок, канал {mbps} Мбит/с')
+        for (fmt, width), rows in results.items():
+            size, elapsed = (self._average(rows),
+                             sum(row[1] for row in rows) / len(rows))
+            self.stdout.write(
+                f'{fmt:>8} {width:>4}w: {size / 1024:7.1f} КБ '
+                f'({size / baseline_bytes:4.0%} от baseline), '
+                f'загрузка {size * 8 / mbps / 1000:6.0f} мс, '
+                f'кодирование {elapsed:5.1f} мс')
+
+    @staticmethod
+    def _average(rows):
+        return sum(row[0] for row in rows) / len(rows)
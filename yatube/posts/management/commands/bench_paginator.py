@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from posts.views import pagination
+
+
+def _render(posts_num, page):
+    request = RequestFactory().get('/', {'page': page})
+    page_obj = pagination(request, range(posts_num), keyset=False,
+                          count=posts_num)
+    return render_to_string('includes/paginator.html',
+                            {'page_obj': page_obj})
+
+
+class Command(BaseCommand):
+    help = ('Меряет время отрисовки навигации по страницам ленты '
+            'при разном числе постов: оно не должно расти.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--posts', type=int, nargs='+',
+                            default=[1000, 200000, 2000000])
+
+    def handle(self, *args, repeat, posts, **options):
+        baseline = None
+        for posts_num in posts:
+            page = max(1, posts_num // 20)
+            _render(posts_num, page)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                html = _render(posts_num, page)
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            baseline = baseline or elapsed
+            self.stdout.write(
+                f'{posts_num:>9} постов: {elapsed:6.3f} мс, '
+                f'ссылок {html.count("<li"):>3}, '
+                f'{elapsed / baseline:4.1f}x от первого')
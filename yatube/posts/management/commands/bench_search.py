@@ -0,0 +1,96 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+LETTERS = 'абвгдеёжзийклмнопрстуфхцчшщыэюя'
+
+
+def _words(rng, count):
+    return [''.join(rng.choice(LETTERS) for _ in range(rng.randint(3, 9)))
+            for _ in range(count)]
+
+
+def _fill(db, rng, posts, comments, vocabulary):
+    # Частоты слов как в живом тексте: немногие слова встречаются часто.
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+
+    def text():
+        return ' '.join(rng.choices(vocabulary, weights,
+                                    k=rng.randint(10, 60)))
+
+    db.execute('CREATE TABLE posts_post (id INTEGER PRIMARY KEY, '
+               'text TEXT, pub_date INTEGER)')
+    db.execute('CREATE TABLE posts_comment (id INTEGER PRIMARY KEY, '
+               'text TEXT, post_id INTEGER)')
+    db.executemany('INSERT INTO posts_post VALUES (?, ?, ?)',
+                   ((pk, text(), pk) for pk in range(1, posts + 1)))
+    db.executemany('INSERT INTO posts_comment VALUES (?, ?, ?)',
+                   ((pk, text(), rng.randint(1, posts))
+                    for pk in range(1, comments + 1)))
+    db.execute(search.CREATE_TABLE)
+    for statement in search.FILL:
+        db.execute(statement)
+    db.commit()
+
+
+def _timed(db, sql, params, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        rows = db.execute(sql, params).fetchall()
+    return rows, (time.perf_counter() - started) / repeat * 1000
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск по индексу FTS5 с LIKE по тексту постов '
+            'на сгенерированной базе SQLite.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--per-page', type=int, default=10)
+
+    def handle(self, *args, posts, comments, queries, repeat, per_page,
+               **options):
+        rng = random.Random(0)
+        vocabulary = _words(rng, 20000)
+        with tempfile.TemporaryDirectory() as directory:
+            db = sqlite3.connect(os.path.join(directory, 'bench.sqlite3'))
+            started = time.perf_counter()
+            _fill(db, rng, posts, comments, vocabulary)
+            self.stdout.write(
+                f'{posts} постов и {comments} комментариев, индекс '
+                f'построен за {time.perf_counter() - started:.1f} с')
+            # Админка: LIKE по тексту, COUNT(*) для счётчика и страница.
+            like_count = 'SELECT COUNT(*) FROM posts_post WHERE text LIKE ?'
+            like_page = ('SELECT id FROM posts_post WHERE text LIKE ? '
+                         'ORDER BY pub_date DESC, id DESC LIMIT ?')
+            fts_page = (f'SELECT post_id, score FROM ({search.MATCHES}) '
+                        'ORDER BY score, post_id DESC LIMIT ?'
+                        ).replace('%s', '?')
+            like_total = fts_total = 0
+            for word in rng.sample(vocabulary[:2000], queries):
+                _, count_ms = _timed(db, like_count, [f'%{word}%'], repeat)
+                _, page_ms = _timed(db, like_page, [f'%{word}%', per_page],
+                                    repeat)
+                rows, fts_ms = _timed(
+                    db, fts_page,
+                    [search.POST, 0.5, search.to_match(word), per_page],
+                    repeat)
+                like_total += count_ms + page_ms
+                fts_total += fts_ms
+                self.stdout.write(
+                    f'{word:>10}: LIKE {count_ms + page_ms:8.1f} мс, '
+                    f'FTS5 {fts_ms:7.1f} мс ({len(rows)} на странице)')
+            db.close()
+        self.stdout.write(
+            f'В среднем: LIKE {like_total / queries:.1f} мс, '
+            f'FTS5 {fts_total / queries:.1f} мс, '
+            f'в {like_total / max(fts_total, 1e-9):.0f} раз быстрее')
@@ -0,0 +1,77 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.media_gc import collect
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из MEDIA_ROOT картинки без постов, варианты '
+            'без PostImageVariant и миниатюры sorl без записи в его '
+            'хранилище ключей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что было бы удалено.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--rate', type=float,
+            help='Не больше стольких файлов в секунду.',
+        )
+        parser.add_argument(
+            '--limit', type=int,
+            help='Остановиться, проверив столько файлов (с точностью '
+                 'до --batch-size), и запомнить, '
+                 'где остановились.',
+        )
+        parser.add_argument(
+            '--min-age', type=int,
+            help='Не удалять файлы моложе стольких секунд '
+                 '(по умолчанию POSTS_MEDIA_GC_MIN_AGE).',
+        )
+        parser.add_argument(
+            '--checkpoint', default=settings.POSTS_MEDIA_GC_CHECKPOINT,
+            help='Файл, в котором запоминается место остановки.',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать обход заново, не глядя на checkpoint.',
+        )
+
+    def handle(self, *args, checkpoint, dry_run=False, restart=False,
+               verbosity=1, **options):
+        start = None
+        if not restart and os.path.exists(checkpoint):
+            with open(checkpoint) as file:
+                start = json.load(file)
+            self.stdout.write(
+                'Продолжаем с {phase}: {after}'.format(**start))
+
+        def report(phase, name, size):
+            if verbosity > 1:
+                self.stdout.write(f'{phase}: {name} ({size} байт)')
+
+        stop, stats = collect(
+            start, dry_run=dry_run, batch_size=options['batch_size'],
+            rate=options['rate'], limit=options['limit'],
+            min_age=options['min_age'], report=report)
+        for phase, values in stats.items():
+            self.stdout.write(
+                '{phase}: проверено {scanned}, удалено {deleted} '
+                '({mb:.1f} МБ)'.format(
+                    phase=phase, mb=values['bytes'] / 2 ** 20, **values))
+        if dry_run:
+            return
+        if stop is None:
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
+            self.stdout.write('Обход закончен.')
+        else:
+            with open(checkpoint, 'w') as file:
+                json.dump(stop, file)
+            self.stdout.write(
+                'Остановились на {phase}: {after}'.format(**stop))
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import bump_generations
+from core.storage import content_hash
+from posts.counts import image_reference
+from posts.media_gc import Originals
+from posts.models import Post, StoredImage
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище по содержимому: '
+            'одинаковые файлы остаются в одном экземпляре.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать дубликаты, ничего не меняя.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, dry_run=False, batch_size=500, **options):
+        storage = Post._meta.get_field('image').storage
+        stats = dict.fromkeys(
+            ('files', 'moved', 'duplicates', 'missing', 'freed'), 0)
+        for name in self.old_names(storage, batch_size):
+            stats['files'] += 1
+            if not storage.exists(name):
+                stats['missing'] += 1
+                continue
+            with storage.open(name) as file:
+                target = storage.content_name(name, content_hash(file))
+                if storage.exists(target):
+                    stats['duplicates'] += 1
+                    stats['freed'] += file.size
+                elif not dry_run:
+                    storage.save_content(target, file)
+            stats['moved'] += 1
+            if not dry_run:
+                self.move(storage, name, target)
+        self.stdout.write(
+            '{files} файлов по старым именам: перенесено {moved}, '
+            'из них дубликатов {duplicates}, не найдено {missing}; '
+            'освобождено {mb:.1f} МБ'.format(
+                mb=stats['freed'] / 2 ** 20, **stats))
+
+    @staticmethod
+    def old_names(storage, batch_size):
+        """Имена картинок постов, ещё не перенесённые в хранилище
+        по содержимому, порциями по batch_size: в памяти только порция.
+        """
+        last = ''
+        while True:
+            names = list(
+                Post.objects.filter(image__gt=last).order_by('image')
+                .values_list('image', flat=True).distinct()[:batch_size])
+            if not names:
+                return
+            last = names[-1]
+            yield from (name for name in names
+                        if not storage.is_content_name(name))
+
+    @staticmethod
+    def move(storage, name, target):
+        posts = Post.objects.filter(image=name)
+        with transaction.atomic():
+            pages = list(posts.values_list(
+                'pk', 'author__username', 'group__slug'))
+            moved = posts.update(image=target, updated=timezone.now())
+            StoredImage.objects.filter(name=name).delete()
+            image_reference(target, moved)
+        # Закешированные карточки и страницы ссылаются на старый файл:
+        # сбрасываем их до того, как он пропадёт.
+        bump_generations('index', *{
+            scope for pk, username, group_slug in pages
+            for scope in (f'card:post:{pk}', f'profile:{username}',
+                          group_slug and f'group:{group_slug}')
+            if scope
+        })
+        # Вместе с файлом - его миниатюры sorl и их записи в KVStore,
+        # как при сборке мусора.
+        Originals().delete(name)
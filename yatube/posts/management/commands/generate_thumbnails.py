@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts.models import Post
+from posts.thumbnails import generate, ready_thumbnail
+
+
+class Command(BaseCommand):
+    help = ('Создаёт недостающие миниатюры и варианты картинок постов, '
+            'например для постов, загруженных до появления фоновой '
+            'очереди.')
+
+    def handle(self, *args, **options):
+        created = 0
+        posts = (Post.objects.exclude(image='').only('image')
+                 .annotate(variants=Count('image_variants')).iterator())
+        for post in posts:
+            if post.variants and all(
+                    ready_thumbnail(post.image, name)
+                    for name in settings.POSTS_THUMBNAILS):
+                continue
+            generate(post.pk)
+            created += 1
+        self.stdout.write(f'Созданы миниатюры для {created} постов')
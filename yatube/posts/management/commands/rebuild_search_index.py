@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = ('Заполняет поисковый индекс заново: нужно после изменений '
+            'постов и комментариев в обход сигналов (bulk_create, update).')
+
+    def handle(self, *args, **options):
+        if not search.available():
+            raise CommandError('Поиск работает только на SQLite (FTS5).')
+        search.rebuild()
+        self.stdout.write('Поисковый индекс заполнен.')
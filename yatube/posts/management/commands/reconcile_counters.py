@@ -0,0 +1,36 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from posts.counts import actual_counts, count_key
+from posts.models import Counter
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики Counter с данными и исправляет расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не меняя.',
+        )
+
+    def handle(self, *args, dry_run=False, **options):
+        for scope, _ in Counter.SCOPES:
+            actual = actual_counts(scope)
+            stored = dict(Counter.objects.filter(scope=scope)
+                          .values_list('object_id', 'value').iterator())
+            drift = {
+                pk: value for pk, value in actual.items()
+                if stored.get(pk) != value
+            }
+            stale = [pk for pk in stored if pk not in actual]
+            self.stdout.write(
+                f'{scope}: расхождений {len(drift)}, лишних {len(stale)}')
+            if dry_run or not (drift or stale):
+                continue
+            Counter.objects.filter(scope=scope, object_id__in=stale).delete()
+            for pk, value in drift.items():
+                Counter.objects.update_or_create(
+                    scope=scope, object_id=pk, defaults={'value': value})
+            cache.delete_many(
+                [count_key(scope, pk) for pk in [*drift, *stale]])
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.thumbnails import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Разбирает очередь миниатюр и вариантов картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать очередь и выйти.')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Пауза в секундах, когда очередь пуста.')
+
+    def handle(self, *args, once=False, interval=2, **options):
+        while True:
+            done = run_pending()
+            if done:
+                self.stdout.write(f'Обработано постов: {done}')
+            if once:
+                break
+            if not done:
+                time.sleep(interval)
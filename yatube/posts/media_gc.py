@@ -0,0 +1,199 @@
+"""Сборка мусора в MEDIA_ROOT: картинки без постов, варианты без строк
+PostImageVariant и миниатюры sorl без записи в его хранилище ключей.
+
+Хранилища обходятся по порядку путей, поэтому обход можно прервать
+и продолжить с последнего обработанного файла (checkpoint).
+"""
+import posixpath
+import time
+
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from .models import Post, PostImageVariant, StoredImage
+
+
+def walk(storage, directory, after='', exclude=()):
+    """Файлы каталога storage в порядке компонентов пути, начиная
+    после after. Каталоги, целиком лежащие до after, не читаются.
+    """
+    after = after.split('/') if after else []
+    dirs, files = storage.listdir(directory)
+    entries = sorted([(name, True) for name in dirs]
+                     + [(name, False) for name in files])
+    for name, is_dir in entries:
+        path = posixpath.join(directory, name)
+        parts = path.split('/')
+        if is_dir:
+            if path in exclude or parts < after[:len(parts)]:
+                continue
+            yield from walk(storage, path, '/'.join(after), exclude)
+        elif parts > after:
+            yield path
+
+
+class Phase:
+    """Один вид файлов: где лежат и какие из них ещё нужны."""
+    name = None
+
+    def storage(self):
+        raise NotImplementedError
+
+    def directory(self):
+        raise NotImplementedError
+
+    def exclude(self):
+        return ()
+
+    def live(self, names):
+        """Имена из names, на которые есть ссылки."""
+        raise NotImplementedError
+
+    def delete(self, name):
+        self.storage().delete(name)
+
+    def files(self, after=''):
+        storage = self.storage()
+        directory = self.directory()
+        if not storage.exists(directory):
+            return iter(())
+        return walk(storage, directory, after, self.exclude())
+
+
+class Originals(Phase):
+    """Исходные картинки, на которые не ссылается ни один пост.
+    Вместе с файлом удаляются его миниатюры sorl и StoredImage.
+    """
+    name = 'originals'
+
+    def storage(self):
+        return Post._meta.get_field('image').storage
+
+    def directory(self):
+        return Post._meta.get_field('image').upload_to.rstrip('/')
+
+    def exclude(self):
+        return (Variants().directory(),)
+
+    def live(self, names):
+        """Кандидаты - файлы с refs == 0 или без строки StoredImage:
+        только для них ссылка проверяется по Post.image, потому что
+        посты из bulk_create в refs не учтены.
+        """
+        live = set(StoredImage.objects.filter(name__in=names, refs__gt=0)
+                   .values_list('name', flat=True))
+        candidates = [name for name in names if name not in live]
+        if candidates:
+            live.update(Post.objects.filter(image__in=candidates)
+                        .values_list('image', flat=True))
+        return live
+
+    def delete(self, name):
+        default.kvstore.delete(ImageFile(name, self.storage()))
+        StoredImage.objects.filter(name=name).delete()
+        super().delete(name)
+
+
+class Variants(Phase):
+    """Варианты картинок, строки которых удалены вместе с постом."""
+    name = 'variants'
+
+    def storage(self):
+        return PostImageVariant._meta.get_field('image').storage
+
+    def directory(self):
+        return (PostImageVariant._meta.get_field('image')
+                .upload_to.rstrip('/'))
+
+    def live(self, names):
+        return set(PostImageVariant.objects.filter(image__in=names)
+                   .values_list('image', flat=True))
+
+
+class Thumbnails(Phase):
+    """Миниатюры sorl, о которых не знает его хранилище ключей."""
+    name = 'thumbnails'
+
+    def storage(self):
+        return default.storage
+
+    def directory(self):
+        return sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+
+    def live(self, names):
+        keys = {add_prefix(ImageFile(name, self.storage()).key): name
+                for name in names}
+        return {keys[key] for key in KVStore.objects.filter(
+            key__in=keys).values_list('key', flat=True)}
+
+
+PHASES = (Originals(), Variants(), Thumbnails())
+
+
+def _batches(files, batch_size):
+    while True:
+        batch = [name for _, name in zip(range(batch_size), files)]
+        if not batch:
+            return
+        yield batch
+
+
+def _collect_batch(phase, batch, dry_run, min_age, stats, report):
+    """Удаляет файлы batch без ссылок, изменённые раньше min_age."""
+    storage = phase.storage()
+    live = phase.live(batch)
+    deadline = time.time() - min_age
+    for name in batch:
+        if name in live:
+            continue
+        try:
+            if storage.get_modified_time(name).timestamp() > deadline:
+                continue
+            size = storage.size(name)
+        except FileNotFoundError:
+            continue
+        if not dry_run:
+            phase.delete(name)
+        stats['deleted'] += 1
+        stats['bytes'] += size
+        if report:
+            report(phase.name, name, size)
+
+
+def collect(checkpoint, dry_run=False, batch_size=500, rate=None,
+            limit=None, min_age=None, report=None):
+    """Проходит фазы начиная с checkpoint ({'phase', 'after'}) и удаляет
+    файлы без ссылок старше min_age секунд (свежий файл может быть ещё
+    не сохранён в посте). Не больше rate файлов в секунду и limit файлов
+    за запуск. Возвращает checkpoint для продолжения или None, если
+    обход закончен, и статистику по фазам.
+    """
+    if min_age is None:
+        min_age = settings.POSTS_MEDIA_GC_MIN_AGE
+    if limit:
+        batch_size = min(batch_size, limit)
+    names = [phase.name for phase in PHASES]
+    start = names.index(checkpoint['phase']) if checkpoint else 0
+    after = checkpoint['after'] if checkpoint else ''
+    stats = {}
+    scanned = 0
+    started = time.monotonic()
+    for phase in PHASES[start:]:
+        phase_stats = stats[phase.name] = dict.fromkeys(
+            ('scanned', 'deleted', 'bytes'), 0)
+        for batch in _batches(phase.files(after), batch_size):
+            _collect_batch(phase, batch, dry_run, min_age, phase_stats,
+                           report)
+            scanned += len(batch)
+            phase_stats['scanned'] += len(batch)
+            if rate:
+                time.sleep(max(
+                    0, scanned / rate - (time.monotonic() - started)))
+            if limit and scanned >= limit:
+                return {'phase': phase.name, 'after': batch[-1]}, stats
+        after = ''
+    return None, stats
@@ -0,0 +1,50 @@
+# Generated by Django 2.2.16 on 2026-10-17 03:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    Counter = apps.get_model('posts', 'Counter')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    sources = [
+        ('group_posts', Post.objects.exclude(group=None), 'group_id'),
+        ('user_posts', Post.objects.all(), 'author_id'),
+        ('user_followers', Follow.objects.all(), 'author_id'),
+        ('user_following', Follow.objects.all(), 'user_id'),
+        ('post_comments', Comment.objects.all(), 'post_id'),
+    ]
+    Counter.objects.create(scope='all_posts', value=Post.objects.count())
+    for scope, queryset, field in sources:
+        counts = queryset.order_by().values_list(field).annotate(Count('pk'))
+        Counter.objects.bulk_create(
+            (Counter(scope=scope, object_id=pk, value=value)
+             for pk, value in counts.iterator()),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('all_posts', 'Все посты'), ('group_posts', 'Посты группы'), ('user_posts', 'Посты автора'), ('user_followers', 'Подписчики'), ('user_following', 'Подписки'), ('post_comments', 'Комментарии к посту')], max_length=20, verbose_name='Счётчик')),
+                ('object_id', models.PositiveIntegerField(default=0, verbose_name='ID объекта')),
+                ('value', models.IntegerField(default=0, verbose_name='Значение')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='counter',
+            constraint=models.UniqueConstraint(fields=('scope', 'object_id'), name='unique_counter'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE posts_search USING fts5('
+        'text, post_id UNINDEXED, kind UNINDEXED, '
+        "tokenize = 'unicode61 remove_diacritics 2')")
+    schema_editor.execute(
+        'INSERT INTO posts_search (rowid, text, post_id, kind) '
+        "SELECT 2 * id, text, id, 'post' FROM posts_post")
+    schema_editor.execute(
+        'INSERT INTO posts_search (rowid, text, post_id, kind) '
+        "SELECT 2 * id + 1, text, post_id, 'comment' FROM posts_comment")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_stored_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
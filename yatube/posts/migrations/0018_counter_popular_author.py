@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def flag_popular_authors(apps, schema_editor):
+    # Посты авторов, популярных уже сейчас, могли не попасть в ленты.
+    Counter = apps.get_model('posts', 'Counter')
+    Follow = apps.get_model('posts', 'Follow')
+    popular = (Follow.objects.order_by().values_list('author_id')
+               .annotate(followers=Count('pk'))
+               .filter(followers__gt=settings.TIMELINE_FANOUT_LIMIT)
+               .values_list('author_id', flat=True))
+    Counter.objects.bulk_create(
+        Counter(scope='popular_author', object_id=pk, value=1)
+        for pk in popular.iterator())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_updated'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='counter',
+            name='scope',
+            field=models.CharField(choices=[('all_posts', 'Все посты'), ('group_posts', 'Посты группы'), ('user_posts', 'Посты автора'), ('user_followers', 'Подписчики'), ('user_following', 'Подписки'), ('post_comments', 'Комментарии к посту'), ('popular_author', 'Популярный автор')], max_length=20, verbose_name='Счётчик'),
+        ),
+        migrations.RunPython(flag_popular_authors,
+                             migrations.RunPython.noop),
+    ]
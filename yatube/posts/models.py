@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from core.models import CreatedModel
+from core.storage import ContentAddressedStorage
 
 from django.contrib.auth import get_user_model
 from django.conf import settings
@@ -17,6 +20,23 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для карточек ленты: автор и группа одним JOIN,
+        только выводимые поля и число комментариев из Counter.
+        """
+        comments = Counter.objects.filter(
+            scope=Counter.POST_COMMENTS,
+            object_id=models.OuterRef('pk'),
+        ).values('value')
+        return (self.select_related('author', 'group')
+                .only('text', 'pub_date', 'image', 'image_placeholder',
+                      'author__username', 'author__first_name',
+                      'author__last_name', 'group__slug', 'group__title')
+                .annotate(comment_count=Coalesce(
+                    models.Subquery(comments), 0)))
+
+
 class Post(CreatedModel):
     text = models.TextField(verbose_name='Текст поста',
                             help_text='Введите текст поста',
@@ -39,16 +59,103 @@ class Post(CreatedModel):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        storage=ContentAddressedStorage(),
+        blank=True,
+        db_index=True
     )
+    # Заполняются при сохранении PostForm (image_variants.describe_image):
+    # шаблонам не нужно открывать файл, чтобы зарезервировать место.
+    image_width = models.PositiveIntegerField('Ширина картинки', null=True,
+                                              blank=True, editable=False)
+    image_height = models.PositiveIntegerField('Высота картинки', null=True,
+                                               blank=True, editable=False)
+    image_size = models.PositiveIntegerField('Размер картинки в байтах',
+                                             null=True, blank=True,
+                                             editable=False)
+    image_placeholder = models.TextField('Размытая заглушка (data: URI)',
+                                         blank=True, editable=False)
+    # Last-Modified страницы поста (posts.freshness).
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date'], name='post_pub_date'),
+            models.Index(fields=['author', '-pub_date'],
+                         name='post_author_pub_date'),
+            models.Index(fields=['group', '-pub_date'],
+                         name='post_group_pub_date'),
+        ]
 
     def __str__(self):
         return self.text[:settings.SYMBOLS_SHOWN]
 
 
+class PostImageVariant(models.Model):
+    """Уменьшенная копия картинки поста одной ширины и формата
+    для <picture srcset>.
+    """
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+        verbose_name='Пост'
+    )
+    format = models.CharField('Формат', max_length=10)
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+    size = models.PositiveIntegerField('Размер в байтах')
+    image = models.FileField('Файл', upload_to='posts/variants/')
+
+    class Meta:
+        ordering = ['width']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'format', 'width'],
+                                    name='unique_image_variant'),
+        ]
+
+    def __str__(self):
+        return f'{self.image.name} ({self.format}, {self.width}w)'
+
+
+class ThumbnailJob(models.Model):
+    """Задача создать миниатюры и варианты картинки поста.
+    Разбирается командой thumbnail_worker (posts.thumbnails.run_pending).
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='thumbnail_job',
+        verbose_name='Пост'
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    run_after = models.DateTimeField('Не раньше', default=timezone.now)
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields=['run_after'], name='thumbnail_job_run_after'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id}: попыток {self.attempts}'
+
+
+class StoredImage(models.Model):
+    """Файл картинки в ContentAddressedStorage и число постов,
+    которые на него ссылаются. Файл без ссылок сразу не удаляется:
+    тот же файл может в этот момент загружаться для другого поста;
+    его потом удаляет collect_media (posts.media_gc).
+    """
+    name = models.CharField('Файл', max_length=100, unique=True)
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.refs}'
+
+
 class Comment(CreatedModel):
     post = models.ForeignKey(
         Post,
@@ -69,6 +176,12 @@ class Comment(CreatedModel):
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            # id в индексе - для keyset-порядка (-pub_date, -id)
+            # без сортировки во временном B-дереве.
+            models.Index(fields=['post', '-pub_date', '-id'],
+                         name='comment_post_pub_date'),
+        ]
 
     def __str__(self):
         return self.text[:settings.SYMBOLS_SHOWN]
@@ -89,5 +202,69 @@ class Follow(models.Model):
     )
 
     class Meta:
-        models.UniqueConstraint(fields=['user', 'author'],
-                                name='unique_ff')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_ff'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Запись ленты подписок: пост автора, разложенный подписчику."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-pub_date'],
+                         name='timeline_user_pub_date'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_post'),
+        ]
+
+
+class Counter(models.Model):
+    """Денормализованный счётчик: число постов, комментариев
+    или подписок для объекта object_id в разрезе scope.
+    """
+    ALL_POSTS = 'all_posts'
+    GROUP_POSTS = 'group_posts'
+    USER_POSTS = 'user_posts'
+    USER_FOLLOWERS = 'user_followers'
+    USER_FOLLOWING = 'user_following'
+    POST_COMMENTS = 'post_comments'
+    POPULAR_AUTHOR = 'popular_author'
+    SCOPES = (
+        (ALL_POSTS, 'Все посты'),
+        (GROUP_POSTS, 'Посты группы'),
+        (USER_POSTS, 'Посты автора'),
+        (USER_FOLLOWERS, 'Подписчики'),
+        (USER_FOLLOWING, 'Подписки'),
+        (POST_COMMENTS, 'Комментарии к посту'),
+        (POPULAR_AUTHOR, 'Популярный автор'),
+    )
+
+    scope = models.CharField('Счётчик', max_length=20, choices=SCOPES)
+    object_id = models.PositiveIntegerField('ID объекта', default=0)
+    value = models.IntegerField('Значение', default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'object_id'],
+                                    name='unique_counter'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}:{self.object_id}={self.value}'
@@ -0,0 +1,178 @@
+import base64
+import binascii
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(post):
+    """Превращает пару (pub_date, id) поста в непрозрачный токен."""
+    raw = f'{post.pub_date.isoformat()}|{post.pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Обратное преобразование токена. Для битого токена вернёт None."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        pub_date, pk = raw.decode().split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class WindowedPaginator(Paginator):
+    """Обычный паджинатор с окном номеров страниц вместо полного списка.
+
+    get_elided_page_range повторяет API Django 3.2. Параметр count
+    позволяет передать готовое число записей вместо COUNT(*).
+    """
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, count=None):
+        super().__init__(object_list, per_page, orphans,
+                         allow_empty_first_page)
+        self.approximate = count is not None
+        if self.approximate:
+            # Число из кеша подменяет COUNT(*) в cached_property count.
+            self.count = count
+
+    def page(self, number):
+        """Срез страницы не обрезается по count:
+        приблизительный счётчик влияет только на навигацию.
+        """
+        if not self.approximate:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        return self._get_page(self.object_list[bottom:top], number, self)
+
+    def get_elided_page_range(self, number=1, *, on_each_side=3, on_ends=2):
+        """Первые и последние on_ends страниц и on_each_side страниц
+        вокруг текущей; пропуски обозначены ELLIPSIS.
+        """
+        number = self.validate_number(number)
+        num_pages = self.num_pages
+        if num_pages <= (on_each_side + on_ends) * 2:
+            yield from range(1, num_pages + 1)
+            return
+        if number > (1 + on_each_side + on_ends) + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < (num_pages - on_each_side - on_ends) - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(num_pages - on_ends + 1, num_pages + 1)
+        else:
+            yield from range(number + 1, num_pages + 1)
+
+
+class KeysetPage(Page):
+    """Страница ленты без номера: навигация только вперёд/назад."""
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<KeysetPage of %s items>' % len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self.object_list[-1])
+        return None
+
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self.object_list[0])
+        return None
+
+    def next_page_number(self):
+        raise NotImplementedError('Используйте next_cursor().')
+
+    def previous_page_number(self):
+        raise NotImplementedError('Используйте previous_cursor().')
+
+    def start_index(self):
+        raise NotImplementedError('Номер записи в keyset-режиме неизвестен.')
+
+    def end_index(self):
+        raise NotImplementedError('Номер записи в keyset-режиме неизвестен.')
+
+
+class KeysetPaginator(Paginator):
+    """Паджинатор по ключу (pub_date, id) от новых постов к старым;
+    подходит и для комментариев.
+
+    Вместо LIMIT/OFFSET и COUNT(*) делает один запрос
+    вида WHERE (pub_date, id) < курсора LIMIT per_page + 1.
+    """
+
+    @property
+    def count(self):
+        raise NotImplementedError('Keyset-паджинатор не считает записи.')
+
+    @property
+    def num_pages(self):
+        raise NotImplementedError('Keyset-паджинатор не считает страницы.')
+
+    @property
+    def page_range(self):
+        raise NotImplementedError('Keyset-паджинатор не считает страницы.')
+
+    def get_page(self, after=None, before=None):
+        """Страница после курсора after, перед курсором before
+        или первая страница, если курсоров нет или они битые.
+        """
+        after = decode_cursor(after)
+        before = decode_cursor(before) if after is None else None
+        if after is not None:
+            return self._page_after(after)
+        if before is not None:
+            return self._page_before(before)
+        return self._page_after(None)
+
+    def _page_after(self, cursor):
+        posts = self.object_list
+        if cursor is not None:
+            pub_date, pk = cursor
+            posts = posts.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+        posts = list(
+            posts.order_by('-pub_date', '-pk')[:self.per_page + 1])
+        has_next = len(posts) > self.per_page
+        return KeysetPage(posts[:self.per_page], self,
+                          has_next=has_next,
+                          has_previous=cursor is not None)
+
+    def _page_before(self, cursor):
+        pub_date, pk = cursor
+        posts = list(self.object_list.filter(
+            Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+        ).order_by('pub_date', 'pk')[:self.per_page + 1])
+        has_previous = len(posts) > self.per_page
+        posts = posts[:self.per_page]
+        posts.reverse()
+        return KeysetPage(posts, self,
+                          has_next=True,
+                          has_previous=has_previous)
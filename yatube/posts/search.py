@@ -0,0 +1,199 @@
+"""Полнотекстовый поиск по постам и комментариям на SQLite FTS5.
+
+Таблица posts_search хранит копию текста: пост под rowid 2 * id,
+комментарий под 2 * id + 1, в post_id - пост, к которому относится
+запись. Её поддерживают сигналы Post и Comment, а заново заполняет
+manage.py rebuild_search_index.
+"""
+import base64
+import binascii
+import re
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection
+
+from .paginators import KeysetPage
+
+TABLE = 'posts_search'
+# Таблицу создаёт миграция 0015_search; схема здесь для bench_search.
+CREATE_TABLE = (
+    f'CREATE VIRTUAL TABLE {TABLE} USING fts5('
+    'text, post_id UNINDEXED, kind UNINDEXED, '
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+POST, COMMENT = 'post', 'comment'
+FILL = (
+    f'INSERT INTO {TABLE} (rowid, text, post_id, kind) '
+    f"SELECT 2 * id, text, id, '{POST}' FROM posts_post",
+    f'INSERT INTO {TABLE} (rowid, text, post_id, kind) '
+    f"SELECT 2 * id + 1, text, post_id, '{COMMENT}' FROM posts_comment",
+)
+# bm25 тем меньше, чем лучше совпадение; совпадение в комментарии
+# весит меньше совпадения в самом посте.
+MATCHES = (
+    f'SELECT post_id, MIN(CASE kind WHEN %s THEN rank '
+    f'ELSE rank * %s END) AS score FROM {TABLE} '
+    f'WHERE {TABLE} MATCH %s GROUP BY post_id'
+)
+WORD = re.compile(r'\w+')
+
+
+def available():
+    """FTS5 есть только в SQLite."""
+    return connection.vendor == 'sqlite'
+
+
+def to_match(query):
+    """Запрос пользователя в выражение MATCH: все слова запроса
+    по префиксу (без стемминга так находятся и другие формы слова).
+    Кавычки и операторы FTS5 в слова не попадают.
+    """
+    words = WORD.findall(query.lower())[:settings.POSTS_SEARCH_MAX_WORDS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _index(rowid, text, post_id, kind):
+    if available():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {TABLE} (rowid, text, post_id, kind) '
+                'VALUES (%s, %s, %s, %s)', [rowid, text, post_id, kind])
+
+
+def _unindex(rowid):
+    if available():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [rowid])
+
+
+def index_post(post):
+    _index(2 * post.pk, post.text, post.pk, POST)
+
+
+def unindex_post(post):
+    _unindex(2 * post.pk)
+
+
+def index_comment(comment):
+    _index(2 * comment.pk + 1, comment.text, comment.post_id, COMMENT)
+
+
+def unindex_comment(comment):
+    _unindex(2 * comment.pk + 1)
+
+
+def rebuild():
+    """Заполняет индекс заново из posts_post и posts_comment."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        for statement in FILL:
+            cursor.execute(statement)
+
+
+def _params(match):
+    return [POST, settings.POSTS_SEARCH_COMMENT_WEIGHT, match]
+
+
+def filter_posts(posts, query):
+    """Посты из posts, в тексте которых или в комментариях к которым
+    есть все слова query. Через extra: RawSQL в pk__in Django 2.2
+    оборачивает вторыми скобками, и SQLite берёт из подзапроса
+    только первую строку.
+    """
+    table = posts.model._meta.db_table
+    return posts.extra(
+        where=[f'"{table}"."id" IN (SELECT post_id FROM {TABLE} '
+               f'WHERE {TABLE} MATCH %s)'],
+        params=[to_match(query)])
+
+
+def filter_comments(comments, query):
+    """Комментарии из comments, в тексте которых есть все слова query."""
+    table = comments.model._meta.db_table
+    return comments.extra(
+        where=[f'"{table}"."id" IN (SELECT rowid / 2 FROM {TABLE} '
+               f'WHERE {TABLE} MATCH %s AND kind = %s)'],
+        params=[to_match(query), COMMENT])
+
+
+def encode_cursor(post):
+    raw = f'{post.search_score!r}|{post.pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        score, pk = raw.decode().split('|')
+        return float(score), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class SearchPage(KeysetPage):
+    """Страница выдачи: курсор - (score, id) поста."""
+
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self.object_list[-1])
+        return None
+
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self.object_list[0])
+        return None
+
+
+class SearchPaginator(Paginator):
+    """Keyset-паджинация выдачи по (score, id) от лучших совпадений
+    к худшим. Страница - один запрос к FTS5 с LIMIT per_page + 1
+    и один запрос постов по найденным id.
+    """
+
+    def __init__(self, query, posts, per_page):
+        super().__init__(posts, per_page)
+        self.match = to_match(query)
+
+    def get_page(self, after=None, before=None):
+        after = decode_cursor(after)
+        before = decode_cursor(before) if after is None else None
+        if not self.match:
+            return SearchPage([], self, has_next=False, has_previous=False)
+        if before is not None:
+            rows = self._rows(
+                'score < %s OR (score = %s AND post_id > %s)', before,
+                'score DESC, post_id')
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return SearchPage(self._posts(rows), self, has_next=True,
+                              has_previous=has_previous)
+        rows = self._rows('score > %s OR (score = %s AND post_id < %s)',
+                          after, 'score, post_id DESC')
+        return SearchPage(self._posts(rows[:self.per_page]), self,
+                          has_next=len(rows) > self.per_page,
+                          has_previous=after is not None)
+
+    def _rows(self, condition, cursor, order):
+        sql = f'SELECT post_id, score FROM ({MATCHES})'
+        params = _params(self.match)
+        if cursor is not None:
+            score, pk = cursor
+            sql += f' WHERE {condition}'
+            params += [score, score, pk]
+        sql += f' ORDER BY {order} LIMIT %s'
+        with connection.cursor() as db:
+            db.execute(sql, params + [self.per_page + 1])
+            return db.fetchall()
+
+    def _posts(self, rows):
+        posts = self.object_list.in_bulk([pk for pk, _ in rows])
+        found = []
+        for pk, score in rows:
+            post = posts.get(pk)
+            if post is not None:
+                post.search_score = score
+                found.append(post)
+        return found
@@ -0,0 +1,138 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import bump_generations
+
+from . import counts, search, timeline
+from .models import Comment, Counter, Follow, Group, Post, User
+
+
+def bump_post_pages(post, *group_slugs):
+    """Сбрасывает закешированные страницы, на которых виден пост."""
+    bump_generations(
+        'index',
+        f'profile:{post.author.username}',
+        *(f'group:{slug}' for slug in group_slugs if slug),
+    )
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    """Запоминаем прежние группу и картинку, чтобы поправить
+    и их счётчики.
+    """
+    instance._old_group_id = instance._old_group_slug = None
+    instance._old_image = ''
+    if instance.pk is not None:
+        (instance._old_group_id, instance._old_group_slug,
+         instance._old_image) = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'group__slug', 'image').first()
+            or (None, None, '')
+        )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if created:
+        counts.increment(Counter.ALL_POSTS)
+        counts.increment(Counter.USER_POSTS, instance.author_id)
+        timeline.fan_out_post(instance)
+    elif old_group_id != instance.group_id and old_group_id:
+        counts.increment(Counter.GROUP_POSTS, old_group_id, -1)
+    if instance.group_id and (created or old_group_id != instance.group_id):
+        counts.increment(Counter.GROUP_POSTS, instance.group_id)
+    old_image = getattr(instance, '_old_image', '') or ''
+    if old_image != (instance.image.name or ''):
+        counts.image_reference(old_image, -1)
+        counts.image_reference(instance.image.name, 1)
+    search.index_post(instance)
+    bump_post_pages(instance, getattr(instance, '_old_group_slug', None),
+                    instance.group and instance.group.slug)
+    bump_generations(f'card:post:{instance.pk}')
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counts.increment(Counter.ALL_POSTS, delta=-1)
+    counts.increment(Counter.USER_POSTS, instance.author_id, -1)
+    if instance.group_id:
+        counts.increment(Counter.GROUP_POSTS, instance.group_id, -1)
+    counts.drop(Counter.POST_COMMENTS, instance.pk)
+    counts.image_reference(instance.image.name, -1)
+    search.unindex_post(instance)
+    bump_post_pages(instance, instance.group and instance.group.slug)
+
+
+def bump_comment_pages(comment):
+    """Сбрасывает страницы с карточкой поста: в ней выводится
+    число комментариев.
+    """
+    row = (Post.objects.filter(pk=comment.post_id)
+           .values_list('author__username', 'group__slug').first())
+    if row is None:
+        return
+    username, group_slug = row
+    bump_generations(
+        'index',
+        f'profile:{username}',
+        *([f'group:{group_slug}'] if group_slug else []),
+        f'card:post:{comment.post_id}',
+    )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counts.increment(Counter.POST_COMMENTS, instance.post_id)
+        bump_comment_pages(instance)
+    search.index_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counts.increment(Counter.POST_COMMENTS, instance.post_id, -1)
+    bump_comment_pages(instance)
+    search.unindex_comment(instance)
+
+
+def bump_follow_pages(follow):
+    """Сбрасывает профили автора (подписчики) и подписчика (подписки)."""
+    bump_generations(f'profile:{follow.author.username}',
+                     f'profile:{follow.user.username}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counts.increment(Counter.USER_FOLLOWERS, instance.author_id)
+        counts.increment(Counter.USER_FOLLOWING, instance.user_id)
+        timeline.backfill(instance.user_id, instance.author_id)
+        bump_follow_pages(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counts.increment(Counter.USER_FOLLOWERS, instance.author_id, -1)
+    counts.increment(Counter.USER_FOLLOWING, instance.user_id, -1)
+    timeline.trim(instance.user_id, instance.author_id)
+    bump_follow_pages(instance)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Название группы выводится в карточках постов на главной
+    # и в списке групп админки.
+    bump_generations('index', f'group:{instance.slug}',
+                     f'card:group:{instance.pk}', 'groups')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Вход на сайт сохраняет только last_login: карточки не меняются.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_generations(f'card:user:{instance.pk}', 'index',
+                     f'profile:{instance.username}')
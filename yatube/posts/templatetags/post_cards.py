@@ -0,0 +1,61 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from core.cache import get_generations
+from posts import thumbnails
+
+register = template.Library()
+
+CARD_KEY = 'post_card:{}:{}:{}:{}:{}:{:d}{:d}'
+
+
+def card_generation_names(post):
+    """Поколения, от которых зависит карточка: сам пост,
+    его автор (имя) и группа (название).
+    """
+    return [f'card:post:{post.pk}', f'card:user:{post.author_id}',
+            f'card:group:{post.group_id}']
+
+
+@register.simple_tag
+def post_cards(posts, show_author_link=False, show_group_link=False):
+    """Список HTML-карточек постов страницы из includes/post.html.
+
+    Готовые карточки берутся из кеша одним get_many, отрисовываются
+    и сохраняются одним set_many только недостающие; их миниатюры
+    ищутся разом через thumbnails.prefetch.
+
+    {% post_cards page_obj show_group_link=True as cards %}
+    """
+    posts = list(posts)
+    names = sorted({name for post in posts
+                    for name in card_generation_names(post)})
+    generations = dict(zip(names, get_generations(names)))
+    keys = [
+        CARD_KEY.format(
+            post.pk,
+            *(generations[name] for name in card_generation_names(post)),
+            getattr(post, 'comment_count', ''),
+            show_author_link, show_group_link)
+        for post in posts
+    ]
+    cards = cache.get_many(keys)
+    card_template = get_template('includes/post.html')
+    missing_posts = {key: post for key, post in zip(keys, posts)
+                     if key not in cards}
+    thumbnails.prefetch(missing_posts.values())
+    missing = {
+        key: card_template.render({
+            'post': post,
+            'show_author_link': show_author_link,
+            'show_group_link': show_group_link,
+        })
+        for key, post in missing_posts.items()
+    }
+    if missing:
+        cache.set_many(missing, settings.POSTS_PAGE_CACHE_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
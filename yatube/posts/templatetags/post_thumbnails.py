@@ -0,0 +1,57 @@
+from django import template
+from django.conf import settings
+
+from posts.image_variants import MIME_TYPES
+from posts.thumbnails import ready_thumbnail, schedule_missing
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, name):
+    """Готовая миниатюра name картинки поста или None, пока она создаётся.
+
+    Здесь миниатюра никогда не создаётся: для недостающей ставится
+    задача в очередь, а шаблон показывает заглушку.
+
+    {% post_thumbnail post "card" as im %}
+    """
+    if not post.image:
+        return None
+    prefetched = getattr(post, 'prefetched_thumbnails', {})
+    if name in prefetched:
+        thumbnail = prefetched[name]
+    else:
+        thumbnail = ready_thumbnail(post.image, name)
+    if thumbnail is None:
+        schedule_missing(post)
+    return thumbnail
+
+
+@register.inclusion_tag('includes/post_picture.html')
+def post_picture(post):
+    """Картинка поста: <picture> с вариантами разной ширины в AVIF,
+    WebP и JPEG, а пока их нет - миниатюра sorl или заглушка.
+    Пока картинка грузится, под ней видна post.image_placeholder.
+
+    {% post_picture post %}
+    """
+    variants = list(post.image_variants.all()) if post.image else []
+    if not variants:
+        return {'post': post, 'thumbnail': post_thumbnail(post, 'card')}
+    srcsets = {}
+    for variant in variants:
+        srcsets.setdefault(variant.format, []).append(
+            f'{variant.image.url} {variant.width}w')
+    fallback = max(variants, key=lambda variant: (
+        variant.format == 'JPEG', variant.width))
+    return {
+        'post': post,
+        'sources': [
+            {'type': MIME_TYPES[fmt], 'srcset': ', '.join(srcsets[fmt])}
+            for fmt in settings.POSTS_IMAGE_FORMATS
+            if fmt in srcsets and fmt != fallback.format
+        ],
+        'fallback': fallback,
+        'fallback_srcset': ', '.join(srcsets[fallback.format]),
+    }
@@ -0,0 +1,169 @@
+import datetime
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.admin import IndexedDatesQuerySet
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class PostAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {num}', slug=f'group-{num}',
+                                 description='Описание')
+            for num in range(3)
+        ]
+        cls.authors = [User.objects.create_user(username=f'author{num}')
+                       for num in range(3)]
+        for num in range(6):
+            Post.objects.create(author=cls.authors[num % 3],
+                                group=cls.groups[num % 3],
+                                text=f'Пост {num}')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:posts_post_changelist')
+
+    def changelist_queries(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Автор, группа и список групп не запрашиваются на каждую строку."""
+        self.changelist_queries()
+        _, before = self.changelist_queries()
+        for num in range(20):
+            Post.objects.create(author=self.authors[num % 3],
+                                group=self.groups[num % 3], text='Ещё')
+        # Счётчик постов перечитывается после их создания.
+        self.changelist_queries()
+        response, after = self.changelist_queries()
+        self.assertEqual(len(after), len(before))
+        self.assertEqual(response.content.decode().count('Группа 1</option>'),
+                         26)
+
+    def test_group_choices_cached(self):
+        """Список групп берётся из кеша и обновляется при их правке."""
+        self.changelist_queries()
+        _, queries = self.changelist_queries()
+        self.assertFalse([sql for sql in queries if 'posts_group' in sql
+                          and 'posts_post' not in sql])
+        self.groups[0].title = 'Переименованная'
+        self.groups[0].save()
+        response, _ = self.changelist_queries()
+        self.assertContains(response, 'Переименованная</option>')
+
+    def test_no_full_count(self):
+        """Без фильтров число постов берётся из счётчика,
+        с фильтром COUNT(*) ограничен POSTS_ADMIN_COUNT_LIMIT.
+        """
+        response, queries = self.changelist_queries()
+        self.assertFalse([sql for sql in queries
+                          if 'COUNT(' in sql and 'posts_post' in sql])
+        self.assertEqual(response.context['cl'].result_count, 6)
+        response, queries = self.changelist_queries({'q': 'Пост'})
+        self.assertEqual(response.context['cl'].result_count, 6)
+        counts = [sql for sql in queries
+                  if 'COUNT(' in sql and 'posts_post' in sql]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT', counts[0])
+
+    @override_settings(POSTS_ADMIN_COUNT_LIMIT=2)
+    def test_pages_beyond_count_limit(self):
+        """Страницы отфильтрованного списка за POSTS_ADMIN_COUNT_LIMIT
+        открываются, и с каждой видна следующая.
+        """
+        PostAdmin = type(admin.site._registry[Post])
+        with mock.patch.object(PostAdmin, 'list_per_page', 2):
+            for page in range(3):
+                with self.subTest(page=page):
+                    response, _ = self.changelist_queries(
+                        {'q': 'Пост', 'p': page})
+                    cl = response.context['cl']
+                    self.assertEqual(len(cl.result_list), 2)
+                    self.assertEqual(cl.paginator.num_pages,
+                                     min(page + 2, 3))
+
+    def test_date_hierarchy(self):
+        """Навигация по датам совпадает с обычной dates()."""
+        for year, month, day in ((2020, 3, 1), (2020, 3, 5), (2021, 12, 31)):
+            post = Post.objects.create(author=self.authors[0], text='Старый')
+            pub_date = timezone.make_aware(
+                datetime.datetime(year, month, day, 23, 30))
+            Post.objects.filter(pk=post.pk).update(pub_date=pub_date)
+        posts = IndexedDatesQuerySet(Post)
+        for kind in ('year', 'month', 'day'):
+            for order in ('ASC', 'DESC'):
+                with self.subTest(kind=kind, order=order):
+                    self.assertEqual(
+                        posts.dates('pub_date', kind, order),
+                        list(Post.objects.dates('pub_date', kind, order)))
+        response, _ = self.changelist_queries()
+        self.assertContains(response, '?pub_date__year=2020')
+        response, _ = self.changelist_queries({'pub_date__year': 2020})
+        self.assertContains(response, 'pub_date__month=3')
+
+
+class CommentFollowAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        cls.author = User.objects.create_user(username='author')
+        post = Post.objects.create(author=cls.author, text='Пост')
+        Comment.objects.create(post=post, author=cls.author,
+                               text='Рыжий кот')
+        Comment.objects.create(post=post, author=cls.author, text='Собака')
+        Follow.objects.create(user=cls.admin, author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_comment_search(self):
+        """Комментарии ищутся по индексу FTS5."""
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'), {'q': 'кот'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([comment.text for comment
+                          in response.context['cl'].result_list],
+                         ['Рыжий кот'])
+
+    def test_estimated_count(self):
+        """Без фильтров число комментариев и подписок оценивается
+        по наибольшему pk, без COUNT(*).
+        """
+        for model, count in ((Comment, 2), (Follow, 1)):
+            with self.subTest(model=model.__name__):
+                url = reverse(f'admin:posts_{model._meta.model_name}'
+                              '_changelist')
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertFalse([query for query in queries
+                                  if 'COUNT(' in query['sql']])
+                self.assertEqual(
+                    response.context['cl'].result_count,
+                    model.objects.order_by('-pk').first().pk)
+                self.assertEqual(len(response.context['cl'].result_list),
+                                 count)
+
+    def test_follow_search(self):
+        response = self.client.get(
+            reverse('admin:posts_follow_changelist'), {'q': 'author'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(
+            reverse('admin:posts_follow_changelist'), {'q': 'auth'})
+        self.assertEqual(response.context['cl'].result_count, 0)
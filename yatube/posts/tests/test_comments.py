@@ -0,0 +1,92 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+THREAD_SIZE = 2000
+
+
+@override_settings(POSTS_COMMENTS_SHOWN=20)
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(
+            User(username=f'reader{num}') for num in range(50))
+        cls.authors = list(User.objects.filter(username__startswith='reader'))
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Вирусный')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.authors[num % 50],
+                    text=f'Комментарий {num}')
+            for num in range(THREAD_SIZE))
+        cls.quiet = Post.objects.create(author=cls.author, text='Тихий')
+        Comment.objects.create(post=cls.quiet, author=cls.authors[0],
+                               text='Один')
+
+    def detail_queries(self, post):
+        url = reverse('posts:post_detail', args=[post.pk])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in queries]
+
+    def test_first_page_only(self):
+        """На странице поста - первая порция комментариев, новые первыми."""
+        response, _ = self.detail_queries(self.post)
+        comments = list(response.context['comments'])
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].text, f'Комментарий {THREAD_SIZE - 1}')
+        self.assertContains(response, 'data-fragment=')
+
+    def test_queries_do_not_depend_on_thread(self):
+        """Число запросов не зависит от размера обсуждения: комментарии
+        с авторами - одним запросом (время - manage.py bench_comments).
+        """
+        response, queries = self.detail_queries(self.post)
+        _, quiet_queries = self.detail_queries(self.quiet)
+        self.assertEqual(len(queries), len(quiet_queries))
+        comment_queries = [sql for sql in queries if 'posts_comment' in sql]
+        self.assertEqual(len(comment_queries), 1)
+        self.assertIn('INNER JOIN "auth_user"', comment_queries[0])
+        self.assertIn('LIMIT 21', comment_queries[0])
+
+    def test_fragments_cover_thread(self):
+        """Фрагменты по курсору отдают всё обсуждение без повторов,
+        каждый - двумя запросами.
+        """
+        url = reverse('posts:post_comments', args=[self.post.pk])
+        seen = []
+        after = None
+        while True:
+            with self.assertNumQueries(2):
+                response = self.client.get(url, {'after': after} if after
+                                           else {})
+            self.assertNotContains(response, '<html')
+            page = response.context['comments']
+            seen.extend(comment.pk for comment in page)
+            if not page.has_next():
+                break
+            after = page.next_cursor()
+        self.assertEqual(len(seen), THREAD_SIZE)
+        self.assertEqual(len(set(seen)), THREAD_SIZE)
+
+    def test_without_javascript(self):
+        """Ссылка «Показать ещё» открывает следующую порцию страницей."""
+        first = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        cursor = first.context['comments'].next_cursor()
+        second = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]),
+            {'after': cursor})
+        self.assertEqual(list(second.context['comments'])[0].text,
+                         f'Комментарий {THREAD_SIZE - 21}')
+
+    def test_missing_post(self):
+        response = self.client.get(reverse('posts:post_comments',
+                                           args=[10 ** 6]))
+        self.assertEqual(response.status_code, 404)
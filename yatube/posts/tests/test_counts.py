@@ -0,0 +1,138 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import counts, timeline
+from posts.models import Comment, Counter, Follow, Group, Post, User
+
+
+class PostCountsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Тестовая группа 2',
+            slug='test-slug-2',
+            description='Тестовое описание 2',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=PostCountsTests.author,
+            text='Тестовый пост',
+            group=PostCountsTests.group,
+        )
+
+    def test_counts_served_from_cache(self):
+        """Повторный запрос счётчика не обращается к базе."""
+        scopes = {
+            'all': lambda: counts.all_post_count(),
+            'group': lambda: counts.group_post_count(self.group),
+            'author': lambda: counts.author_post_count(self.author),
+            'follow': lambda: counts.follow_post_count(self.reader),
+        }
+        for scope, get_count in scopes.items():
+            with self.subTest(scope=scope):
+                self.assertEqual(get_count(), 1)
+                # Лента подписок ищет популярных авторов и считает
+                # свои записи TimelineEntry по индексу.
+                with self.assertNumQueries(2 if scope == 'follow' else 0):
+                    self.assertEqual(get_count(), 1)
+
+    def test_counts_invalidated_on_create_and_delete(self):
+        """Создание и удаление поста сбрасывают счётчики."""
+        counts.all_post_count()
+        counts.follow_post_count(self.reader)
+        Post.objects.create(author=self.author, text='Ещё один пост',
+                            group=self.group)
+        self.assertEqual(counts.all_post_count(), 2)
+        self.assertEqual(counts.group_post_count(self.group), 2)
+        self.assertEqual(counts.follow_post_count(self.reader), 2)
+        self.post.delete()
+        self.assertEqual(counts.all_post_count(), 1)
+        self.assertEqual(counts.author_post_count(self.author), 1)
+
+    @override_settings(TIMELINE_BACKFILL=2)
+    def test_follow_count_matches_timeline(self):
+        """В ленту при подписке попадают только TIMELINE_BACKFILL
+        постов автора: число постов ленты считается по ней, а не по
+        всем постам автора.
+        """
+        author = User.objects.create_user(username='prolific')
+        Post.objects.bulk_create(
+            Post(author=author, text=f'Пост {num}') for num in range(5))
+        Follow.objects.create(user=self.reader, author=author)
+        Post.objects.create(author=author, text='Новый пост')
+        feed = timeline.follow_feed(self.reader)
+        self.assertEqual(counts.follow_post_count(self.reader), 4)
+        self.assertEqual(counts.follow_post_count(self.reader), feed.count())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_follow_count_with_popular_authors(self):
+        """Посты популярных авторов считаются по их счётчикам."""
+        feed = timeline.follow_feed(self.reader)
+        self.assertEqual(counts.follow_post_count(self.reader), 1)
+        self.assertEqual(counts.follow_post_count(self.reader), feed.count())
+
+    def test_group_change_invalidates_both_groups(self):
+        """Перенос поста в другую группу меняет счётчики обеих групп."""
+        self.assertEqual(counts.group_post_count(self.group), 1)
+        self.assertEqual(counts.group_post_count(self.other_group), 0)
+        self.post.group = self.other_group
+        self.post.save()
+        self.assertEqual(counts.group_post_count(self.group), 0)
+        self.assertEqual(counts.group_post_count(self.other_group), 1)
+
+    def test_profile_does_not_count_posts(self):
+        """Страница профиля берёт число постов из кеша."""
+        counts.author_post_count(self.author)
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(url)
+        self.assertEqual(response.context['posts_count'], 1)
+        for query in queries:
+            self.assertNotIn('__count"', query['sql'])
+
+    def test_follow_and_comment_counters(self):
+        """Подписки и комментарии меняют свои счётчики."""
+        self.assertEqual(counts.user_counts(self.author), (1, 1, 0))
+        self.assertEqual(counts.user_counts(self.reader), (0, 0, 1))
+        comment = Comment.objects.create(post=self.post, author=self.reader,
+                                         text='Комментарий')
+        self.assertEqual(
+            counts.counter_value(Counter.POST_COMMENTS, self.post.pk), 1)
+        self.assertEqual(Post.objects.for_feed().get().comment_count, 1)
+        comment.delete()
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(counts.user_counts(self.author), (1, 0, 0))
+        self.assertEqual(Post.objects.for_feed().get().comment_count, 0)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """reconcile_counters возвращает счётчикам настоящие значения."""
+        Counter.objects.filter(scope=Counter.USER_POSTS).update(value=42)
+        Counter.objects.create(scope=Counter.POST_COMMENTS, object_id=999,
+                               value=3)
+        call_command('reconcile_counters', '--dry-run', stdout=StringIO())
+        self.assertEqual(counts.author_post_count(self.author), 42)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(counts.author_post_count(self.author), 1)
+        self.assertFalse(Counter.objects.filter(object_id=999).exists())
+        for scope, _ in Counter.SCOPES:
+            with self.subTest(scope=scope):
+                stored = dict(Counter.objects.filter(scope=scope)
+                              .values_list('object_id', 'value'))
+                self.assertEqual(stored, counts.actual_counts(scope))
@@ -1,9 +1,15 @@
+import base64
+import hashlib
 import shutil
 import tempfile
+from io import BytesIO
+
+from PIL import Image
 
 from posts.forms import PostForm
 from posts.models import Post, User, Group, Comment
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
@@ -71,7 +77,8 @@ class PostFormTests(TestCase):
         new_post = Post.objects.latest('id')
         self.assertEqual(new_post.author, self.user)
         self.assertEqual(new_post.group, PostFormTests.group)
-        self.assertEqual(new_post.image, 'posts/small.gif')
+        digest = hashlib.sha256(small_gif).hexdigest()
+        self.assertEqual(new_post.image, f'posts/{digest[:2]}/{digest}.gif')
         self.assertRedirects(response, reverse(
             'posts:profile', kwargs={'username':
                                      self.user.username}))
@@ -163,3 +170,76 @@ class PostFormTests(TestCase):
         self.assertEqual(Post.objects.count(), comm_count + 1)
         # комм-й относится в правильному посту
         self.assertEqual(new_comm.post.id, expected.id)
+
+
+def image_upload(name, size, fmt='PNG', orientation=None):
+    buffer = BytesIO()
+    options = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        options['exif'] = exif.tobytes()
+    Image.new('RGB', size, 'blue').save(buffer, fmt, **options)
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type=f'image/{fmt.lower()}')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageMetadataTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create(self, image):
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'Пост с картинкой', 'image': image})
+        return Post.objects.latest('id')
+
+    def test_metadata_saved_with_post(self):
+        """PostForm запоминает размеры, байты и заглушку картинки."""
+        image = image_upload('wide.png', (300, 200))
+        post = self.create(image)
+        self.assertEqual((post.image_width, post.image_height),
+                         (300, 200))
+        self.assertEqual(post.image_size, image.size)
+        prefix = 'data:image/png;base64,'
+        self.assertTrue(post.image_placeholder.startswith(prefix))
+        placeholder = Image.open(BytesIO(base64.b64decode(
+            post.image_placeholder[len(prefix):])))
+        self.assertEqual(placeholder.size, (16, 6))
+
+    def test_exif_rotation(self):
+        """Размеры учитывают поворот из EXIF."""
+        post = self.create(image_upload('photo.jpg', (300, 200), 'JPEG',
+                                        orientation=6))
+        self.assertEqual((post.image_width, post.image_height),
+                         (200, 300))
+
+    def test_edit_keeps_or_clears_metadata(self):
+        """Правка без картинки сохраняет данные, удаление - сбрасывает."""
+        post = self.create(image_upload('wide.png', (300, 200)))
+        url = reverse('posts:post_edit', args=[post.pk])
+        self.client.post(url, {'text': 'Новый текст'})
+        post.refresh_from_db()
+        self.assertEqual(post.image_width, 300)
+        self.client.post(url, {'text': 'Без картинки', 'image-clear': 'on'})
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_placeholder),
+                         (None, ''))
+
+    def test_placeholder_rendered_in_cards(self):
+        """Карточка показывает заглушку до загрузки картинки."""
+        post = self.create(image_upload('wide.png', (300, 200)))
+        cache.clear()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, post.image_placeholder)
@@ -0,0 +1,221 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(author=cls.author, text='Пост',
+                                       group=cls.group)
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+        cls.urls = {
+            'post': reverse('posts:post_detail',
+                            kwargs={'post_id': cls.post.pk}),
+            'profile': reverse('posts:profile',
+                               kwargs={'username': cls.author.username}),
+            'group': reverse('posts:group_list',
+                             kwargs={'slug': cls.group.slug}),
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        # Last-Modified с точностью до секунды, а тест укладывается
+        # в одну: время сдвигает tick().
+        self.now = time.time()
+        clock = mock.patch('time.time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def tick(self):
+        self.now += 2
+
+    def revalidate(self, url, response, client=None):
+        return (client or self.client).get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def last_modified(self, url):
+        self.client.get(url)
+        self.tick()
+        return self.client.get(url)['Last-Modified']
+
+    def test_validators(self):
+        """Страницы отдают ETag, Last-Modified и no-cache."""
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                self.client.get(url)
+                self.tick()
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.has_header('ETag'))
+                self.assertTrue(response.has_header('Last-Modified'))
+                self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_not_modified_without_heavy_queries(self):
+        """304 стоит одного запроса признака свежести, шаблоны
+        не рендерятся.
+        """
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.client.get(url)
+                with self.assertNumQueries(1):
+                    response = self.revalidate(url, response)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertFalse(response.templates)
+                self.assertTrue(response.has_header('ETag'))
+
+    def test_if_modified_since(self):
+        """Клиенты без ETag получают 304 по Last-Modified."""
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=self.last_modified(url))
+                self.assertEqual(response.status_code, 304)
+
+    def test_no_last_modified_in_the_second_of_change(self):
+        """Пока идёт секунда изменения, Last-Modified не отдаётся:
+        следующее изменение в ту же секунду его бы не сдвинуло.
+        """
+        self.tick()
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Новый комментарий')
+        response = self.client.get(self.urls['post'])
+        self.assertTrue(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_if_modified_since_after_changes(self):
+        """Last-Modified растёт при любом изменении страницы, и клиент
+        без ETag получает её заново.
+        """
+        def comment():
+            Comment.objects.create(post=self.post, author=self.reader,
+                                   text='Новый комментарий')
+
+        def edit():
+            self.post.text = 'Исправленный пост'
+            self.post.save()
+
+        def delete_latest():
+            Post.objects.filter(author=self.author).first().delete()
+
+        def follow():
+            Follow.objects.create(user=self.reader, author=self.author)
+
+        def rename():
+            self.author.first_name = 'Новое имя'
+            self.author.save()
+
+        def new_post():
+            Post.objects.create(author=self.author, text='Новый пост')
+
+        changes = {
+            'comment': (comment, ('post', 'profile', 'group')),
+            'edit': (edit, ('post', 'profile', 'group')),
+            'delete latest post': (delete_latest, ('profile', 'group')),
+            'follow': (follow, ('profile',)),
+            'rename author': (rename, ('post', 'profile')),
+            'new post by author': (new_post, ('post', 'profile')),
+        }
+        for change, (make_change, pages) in changes.items():
+            Post.objects.create(author=self.author, text='Последний пост',
+                                group=self.group)
+            modified = {page: self.last_modified(self.urls[page])
+                        for page in pages}
+            self.tick()
+            make_change()
+            self.tick()
+            for page in pages:
+                with self.subTest(change=change, page=page):
+                    response = self.client.get(
+                        self.urls[page],
+                        HTTP_IF_MODIFIED_SINCE=modified[page])
+                    self.assertEqual(response.status_code, 200)
+
+    def test_new_comment_changes_post(self):
+        response = self.client.get(self.urls['post'])
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Новый комментарий')
+        response = self.revalidate(self.urls['post'], response)
+        self.assertContains(response, 'Новый комментарий')
+
+    def test_edit_changes_post(self):
+        post = Post.objects.create(author=self.author, text='Черновик')
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        response = self.client.get(url)
+        post.text = 'Исправленный пост'
+        post.save()
+        response = self.revalidate(url, response)
+        self.assertContains(response, 'Исправленный пост')
+
+    def test_new_post_changes_profile_and_group(self):
+        responses = {name: self.client.get(self.urls[name])
+                     for name in ('profile', 'group')}
+        Post.objects.create(author=self.author, text='Новый пост',
+                            group=self.group)
+        for name, response in responses.items():
+            with self.subTest(page=name):
+                response = self.revalidate(self.urls[name], response)
+                self.assertContains(response, 'Новый пост')
+
+    def test_new_post_changes_author_count_on_post(self):
+        """На странице поста выводится число постов автора."""
+        response = self.client.get(self.urls['post'])
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.revalidate(self.urls['post'], response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['posts_per_auth'], 2)
+
+    def test_new_comment_changes_profile_and_group(self):
+        """Карточки профиля и группы показывают число комментариев."""
+        responses = {name: self.client.get(self.urls[name])
+                     for name in ('profile', 'group')}
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Новый комментарий')
+        for name, response in responses.items():
+            with self.subTest(page=name):
+                response = self.revalidate(self.urls[name], response)
+                self.assertContains(response, '(комментариев: 2)')
+
+    def test_follow_changes_profile(self):
+        """Число подписчиков не видно по времени постов, но сдвигает
+        поколение профиля.
+        """
+        response = self.client.get(self.urls['profile'])
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.revalidate(self.urls['profile'], response)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """Чужая копия страницы не подходит: в шапке имя пользователя."""
+        response = self.client.get(self.urls['post'])
+        reader = Client()
+        reader.force_login(self.reader)
+        response = self.revalidate(self.urls['post'], response, reader)
+        self.assertContains(response, self.reader.username)
+
+    def test_missing_pages(self):
+        urls = [
+            reverse('posts:post_detail', kwargs={'post_id': 0}),
+            reverse('posts:profile', kwargs={'username': 'nobody'}),
+            reverse('posts:group_list', kwargs={'slug': 'nothing'}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertFalse(response.has_header('ETag'))
@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from posts import thumbnails
+from posts.media_gc import Originals, walk
+from posts.models import Post, StoredImage, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def image_file(color):
+    buffer = BytesIO()
+    Image.new('RGB', (400, 200), color).save(buffer, 'PNG')
+    return SimpleUploadedFile('image.png', buffer.getvalue(),
+                              content_type='image/png')
+
+
+def media_files():
+    return {
+        os.path.relpath(os.path.join(root, name), TEMP_MEDIA_ROOT)
+        for root, _, names in os.walk(TEMP_MEDIA_ROOT) for name in names}
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CollectMediaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        cache.clear()
+        self.checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'gc.json')
+        self.kept = Post.objects.create(author=self.user, text='Живой',
+                                        image=image_file('red'))
+        thumbnails.generate(self.kept.pk)
+        self.live_files = media_files()
+        deleted = Post.objects.create(author=self.user, text='Удалённый',
+                                      image=image_file('blue'))
+        thumbnails.generate(deleted.pk)
+        self.orphan = deleted.image.name
+        deleted.delete()
+        # Миниатюра, о которой хранилище ключей sorl не знает.
+        default_storage.save('cache/00/00/stray.jpg', ContentFile(b'jpg'))
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media', '--min-age', '0', '--checkpoint',
+                     self.checkpoint, *args, stdout=out)
+        return out.getvalue()
+
+    def test_orphans_deleted(self):
+        """Удаляются файлы удалённого поста и ничейные миниатюры,
+        файлы живого поста остаются.
+        """
+        self.assertGreater(len(media_files() - self.live_files), 3)
+        self.collect()
+        self.assertEqual(media_files(), self.live_files)
+        self.assertFalse(StoredImage.objects.filter(name=self.orphan))
+        self.assertIsNotNone(
+            thumbnails.ready_thumbnail(self.kept.image, 'card'))
+
+    def test_live_originals_by_refs(self):
+        """Файлы с refs > 0 живы без запроса к постам; файлы без
+        ссылок проверяются по Post.image.
+        """
+        with self.assertNumQueries(1):
+            self.assertEqual(Originals().live([self.kept.image.name]),
+                             {self.kept.image.name})
+        Post.objects.bulk_create([Post(author=self.user,
+                                       text='Без сигналов',
+                                       image=self.orphan)])
+        self.assertEqual(
+            Originals().live([self.kept.image.name, self.orphan]),
+            {self.kept.image.name, self.orphan})
+        Post.objects.filter(image=self.orphan).delete()
+        StoredImage.objects.filter(name=self.kept.image.name).update(refs=0)
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                Originals().live([self.kept.image.name, self.orphan]),
+                {self.kept.image.name})
+
+    def test_dry_run(self):
+        """--dry-run ничего не удаляет."""
+        before = media_files()
+        output = self.collect('--dry-run')
+        self.assertEqual(media_files(), before)
+        self.assertIn('originals: проверено 2, удалено 1', output)
+
+    def test_fresh_files_kept(self):
+        """Файлы моложе POSTS_MEDIA_GC_MIN_AGE не удаляются."""
+        before = media_files()
+        call_command('collect_media', '--checkpoint', self.checkpoint,
+                     stdout=StringIO())
+        self.assertEqual(media_files(), before)
+
+    def test_resume_from_checkpoint(self):
+        """С --limit обход останавливается и продолжается
+        с места остановки.
+        """
+        total = len(media_files())
+        runs = 0
+        while True:
+            runs += 1
+            output = self.collect('--limit', '2', '--batch-size', '1')
+            if 'Обход закончен' in output:
+                break
+            with open(self.checkpoint) as file:
+                self.assertIn('after', json.load(file))
+            self.assertLess(runs, total)
+        self.assertGreater(runs, 2)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertEqual(media_files(), self.live_files)
+
+    def test_walk_order_and_resume(self):
+        """walk обходит файлы по порядку пути и начинает после after."""
+        names = list(walk(default_storage, 'posts'))
+        self.assertEqual(names, sorted(names, key=lambda n: n.split('/')))
+        self.assertEqual(list(walk(default_storage, 'posts', names[1])),
+                         names[2:])
@@ -1,7 +1,12 @@
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-from ..models import Group, Post
+from ..freshness import latest_post_date
+from ..models import Comment, Follow, Group, Post
 
 User = get_user_model()
 
@@ -58,3 +63,90 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+
+class FeedIndexTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый текст длиной не менее 15 символов',
+            group=cls.group,
+        )
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(FeedIndexTest.reader)
+
+    def query_plan(self, url, table):
+        """План запроса страницы, который читает ленту из table."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        # Признаки свежести страниц (posts.freshness) проверяет
+        # test_freshness_queries_use_indexes.
+        feed_queries = [
+            query['sql'] for query in queries
+            if f'FROM "{table}"' in query['sql']
+            and 'ORDER BY' in query['sql']
+            and not query['sql'].startswith(
+                f'SELECT "{table}"."pub_date" FROM')
+        ]
+        self.assertEqual(len(feed_queries), 1, feed_queries)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + feed_queries[0])
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент читают посты по индексу без сортировки."""
+        feeds = {
+            reverse('posts:index'): ('posts_post', 'post_pub_date'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}):
+            ('posts_post', 'post_group_pub_date'),
+            reverse('posts:profile', kwargs={'username': self.user}):
+            ('posts_post', 'post_author_pub_date'),
+            reverse('posts:follow_index'):
+            ('posts_post', 'timeline_user_pub_date'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}):
+            ('posts_comment', 'comment_post_pub_date'),
+        }
+        for url, (table, index) in feeds.items():
+            with self.subTest(url=url):
+                plan = self.query_plan(url, table)
+                self.assertIn(f'USING INDEX {index}', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_freshness_queries_use_indexes(self):
+        """Последний пост автора и группы ищется по индексу лент."""
+        queries = {
+            'post_author_pub_date':
+            Post.objects.filter(author__username=self.user.username),
+            'post_group_pub_date':
+            Post.objects.filter(group__slug=self.group.slug),
+        }
+        for index, posts in queries.items():
+            with self.subTest(index=index):
+                with CaptureQueriesContext(connection) as captured:
+                    latest_post_date(posts)
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'EXPLAIN QUERY PLAN ' + captured[0]['sql'])
+                    plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertIn(f'INDEX {index}', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_follow_is_unique(self):
+        """Повторная подписка на автора не проходит в базе."""
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=self.reader, author=self.user)
@@ -0,0 +1,64 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from posts.models import Group, Post, User
+from posts.templatetags.post_cards import post_cards
+
+
+class PostCardsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth',
+                                            first_name='Иван')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый текст',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, **flags):
+        return ''.join(post_cards(Post.objects.for_feed(), **flags))
+
+    def test_cards_cached_until_post_changes(self):
+        """Карточка берётся из кеша, пока пост не изменён."""
+        self.assertIn('Тестовый текст', self.render())
+        Post.objects.update(text='Текст без сигналов')
+        self.assertIn('Тестовый текст', self.render())
+        post = Post.objects.get()
+        post.text = 'Новый текст'
+        post.save()
+        self.assertIn('Новый текст', self.render())
+
+    def test_author_and_group_changes_invalidate_cards(self):
+        """Смена имени автора или названия группы обновляет карточку."""
+        self.render(show_group_link=True)
+        self.user.first_name = 'Пётр'
+        self.user.save()
+        self.group.title = 'Новая группа'
+        self.group.save()
+        html = self.render(show_group_link=True)
+        self.assertIn('Пётр', html)
+        self.assertIn('Новая группа', html)
+
+    def test_variants_cached_separately(self):
+        """Флаги show_author_link/show_group_link дают разные карточки."""
+        self.assertNotIn('все записи группы', self.render())
+        self.assertIn('все записи группы', self.render(show_group_link=True))
+
+    def test_cached_page_rendered_with_one_get_many(self):
+        """Страница из закешированных карточек не рендерит шаблон."""
+        Post.objects.create(author=self.user, text='Второй пост')
+        self.render()
+        posts = list(Post.objects.for_feed())
+        with self.assertTemplateNotUsed('includes/post.html'):
+            cards = post_cards(posts)
+        self.assertEqual(len(cards), 2)
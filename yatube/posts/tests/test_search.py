@@ -0,0 +1,136 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts import search
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+
+class SearchIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.cat = Post.objects.create(author=cls.user,
+                                      text='Рыжий кот спит на диване')
+        cls.dog = Post.objects.create(author=cls.user,
+                                      text='Собака гуляет во дворе')
+
+    def found(self, query):
+        return set(search.filter_posts(Post.objects.all(), query))
+
+    def test_posts_and_comments_indexed(self):
+        """Посты находятся по своему тексту и тексту комментариев."""
+        Comment.objects.create(post=self.dog, author=self.user,
+                               text='А кот её боится')
+        self.assertEqual(self.found('кот'), {self.cat, self.dog})
+        self.assertEqual(self.found('диван кот'), {self.cat})
+
+    def test_prefix_and_case(self):
+        """Слова ищутся без учёта регистра и по началу слова."""
+        self.assertEqual(self.found('СОБАК'), {self.dog})
+
+    def test_index_follows_changes(self):
+        """Правка и удаление поста и комментария обновляют индекс."""
+        post = Post.objects.create(author=self.user, text='Серый кот')
+        post.text = 'Рыжая лиса'
+        post.save()
+        self.assertEqual(self.found('кот'), {self.cat})
+        self.assertEqual(self.found('лиса'), {post})
+        comment = Comment.objects.create(post=self.dog, author=self.user,
+                                         text='Лиса во дворе')
+        comment.delete()
+        self.assertEqual(self.found('лиса'), {post})
+        post.delete()
+        self.assertEqual(self.found('лиса'), set())
+
+    def test_rebuild(self):
+        """rebuild находит посты, созданные в обход сигналов."""
+        Post.objects.bulk_create([Post(author=self.user, text='Тихий ёж')])
+        self.assertEqual(self.found('ёж'), set())
+        search.rebuild()
+        self.assertEqual(len(self.found('ёж')), 1)
+
+    def test_query_operators_ignored(self):
+        """Кавычки и операторы FTS5 в запросе не ломают поиск."""
+        self.assertEqual(search.to_match('кот" OR (NEAR'),
+                         '"кот"* "or"* "near"*')
+        self.assertEqual(self.found('"кот" -диван*'), {self.cat})
+
+
+@override_settings(POSTS_SHOWN=2)
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.best = Post.objects.create(
+            author=cls.user, text='Кот, кот и ещё раз кот')
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Пост {num} про кот')
+            for num in range(3)
+        ]
+        cls.by_comment = Post.objects.create(author=cls.user,
+                                             text='Без животных')
+        Comment.objects.create(post=cls.by_comment, author=cls.user,
+                               text='кот')
+        Post.objects.create(author=cls.user, text='Совсем про другое')
+
+    def pages(self, query):
+        """Все страницы выдачи по курсору after."""
+        url = reverse('posts:search')
+        params = {'q': query}
+        found = []
+        while True:
+            response = self.client.get(url, params)
+            page = response.context['page_obj']
+            found.extend(page)
+            if not page.has_next():
+                return found
+            params['after'] = page.next_cursor()
+
+    def test_ranked_keyset_pages(self):
+        """Выдача по страницам без повторов, лучшие совпадения первыми,
+        совпадение в комментарии - после совпадений в постах.
+        """
+        found = self.pages('кот')
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found),
+                         {self.best, *self.posts, self.by_comment})
+        self.assertEqual(found[0], self.best)
+        self.assertEqual(found[-1], self.by_comment)
+        scores = [post.search_score for post in found]
+        self.assertEqual(scores, sorted(scores))
+
+    def test_previous_page(self):
+        """Курсор before возвращает на предыдущую страницу."""
+        url = reverse('posts:search')
+        first = self.client.get(url, {'q': 'кот'}).context['page_obj']
+        second = self.client.get(
+            url, {'q': 'кот', 'after': first.next_cursor()}
+        ).context['page_obj']
+        back = self.client.get(
+            url, {'q': 'кот', 'before': second.previous_cursor()}
+        ).context['page_obj']
+        self.assertEqual(list(back), list(first))
+
+    def test_page_links_keep_query(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'кот'})
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82&amp;after=')
+
+    def test_empty_queries(self):
+        """Пустой запрос и запрос без слов ничего не ищут."""
+        for query in ('', '!!!'):
+            with self.subTest(query=query):
+                response = self.client.get(reverse('posts:search'),
+                                           {'q': query})
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.context['page_obj'])
+
+    def test_admin_search(self):
+        """Поиск в админке идёт через индекс."""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:posts_post_changelist'),
+                                   {'q': 'кот'})
+        self.assertEqual(response.context['cl'].result_count, 5)
@@ -0,0 +1,195 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.models import KVStore
+
+from core.cache import get_generations
+from core.storage import ContentAddressedStorage
+from posts.image_variants import create_variants
+from posts.models import Post, StoredImage, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def image_file(name='image.png', color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (60, 30), color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/png')
+
+
+def media_files():
+    return sorted(
+        os.path.relpath(os.path.join(root, name), TEMP_MEDIA_ROOT)
+        for root, _, names in os.walk(TEMP_MEDIA_ROOT) for name in names)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, image):
+        return Post.objects.create(author=self.user, text='Текст',
+                                   image=image)
+
+    def test_same_content_stored_once(self):
+        """Одинаковые картинки под разными именами - один файл."""
+        first = self.create_post(image_file('cat.png'))
+        second = self.create_post(image_file('CAT_copy.PNG'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(
+            ContentAddressedStorage.is_content_name(first.image.name))
+        self.assertEqual(media_files(), [first.image.name])
+        self.assertEqual(
+            StoredImage.objects.get(name=first.image.name).refs, 2)
+
+    def test_different_content_stored_separately(self):
+        """Разные картинки с одинаковым именем не затирают друг друга."""
+        red = self.create_post(image_file('cat.png', 'red'))
+        blue = self.create_post(image_file('cat.png', 'blue'))
+        self.assertNotEqual(red.image.name, blue.image.name)
+        self.assertEqual(len(media_files()), 2)
+
+    def test_references_follow_posts(self):
+        """Удаление и замена картинки уменьшают число ссылок."""
+        first = self.create_post(image_file())
+        second = self.create_post(image_file())
+        name = first.image.name
+        first.delete()
+        self.assertEqual(StoredImage.objects.get(name=name).refs, 1)
+        second.image = image_file(color='blue')
+        second.save()
+        self.assertEqual(StoredImage.objects.get(name=name).refs, 0)
+        self.assertEqual(
+            StoredImage.objects.get(name=second.image.name).refs, 1)
+
+    def test_variants_shared(self):
+        """Варианты картинки создаются один раз на все её посты."""
+        first = self.create_post(image_file())
+        second = self.create_post(image_file())
+        variants = create_variants(first)
+        shared = create_variants(second)
+        self.assertEqual(
+            sorted(variant.image.name for variant in variants),
+            sorted(variant.image.name for variant in shared))
+        first.delete()
+        for variant in shared:
+            with self.subTest(variant=variant.image.name):
+                self.assertTrue(variant.image.storage.exists(
+                    variant.image.name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DedupeImagesCommandTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        storage = Post._meta.get_field('image').storage
+        # Картинки, загруженные до хранилища по содержимому.
+        content = image_file().read()
+        for name in ('posts/a.png', 'posts/b.png'):
+            os.makedirs(os.path.dirname(storage.path(name)), exist_ok=True)
+            with open(storage.path(name), 'wb') as file:
+                file.write(content)
+        Post.objects.bulk_create(
+            Post(author=self.user, text=name, image=name)
+            for name in ('posts/a.png', 'posts/a.png', 'posts/b.png'))
+        self.size = len(content)
+
+    def dedupe(self, *args):
+        out = StringIO()
+        call_command('dedupe_images', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        """--dry-run только считает дубликаты."""
+        output = self.dedupe('--dry-run')
+        self.assertIn('2 файлов', output)
+        self.assertEqual(media_files(), ['posts/a.png', 'posts/b.png'])
+        self.assertEqual(
+            set(Post.objects.values_list('image', flat=True)),
+            {'posts/a.png', 'posts/b.png'})
+
+    def test_duplicates_merged(self):
+        """Дубликаты сливаются в один файл со счётчиком ссылок."""
+        output = self.dedupe('--batch-size', '1')
+        self.assertIn('дубликатов 1', output)
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertEqual(media_files(), [name])
+        self.assertEqual(StoredImage.objects.get(name=name).refs, 3)
+        self.assertIn('0 файлов', self.dedupe())
+
+    def test_cached_pages_invalidated(self):
+        """Карточки и страницы со старым адресом картинки сброшены
+        до удаления старого файла.
+        """
+        scopes = {
+            name: ['index', 'profile:auth'] + [
+                f'card:post:{pk}' for pk in
+                Post.objects.filter(image=name).values_list('pk', flat=True)]
+            for name in ('posts/a.png', 'posts/b.png')
+        }
+        before = {name: get_generations(names)
+                  for name, names in scopes.items()}
+        storage = Post._meta.get_field('image').storage
+        delete = storage.delete
+        deleted = []
+
+        def check_and_delete(name):
+            for old, new in zip(before[name], get_generations(scopes[name])):
+                self.assertNotEqual(old, new)
+            deleted.append(name)
+            delete(name)
+
+        with mock.patch.object(storage, 'delete', check_and_delete):
+            self.dedupe()
+        self.assertEqual(sorted(deleted), ['posts/a.png', 'posts/b.png'])
+
+    def test_old_thumbnails_deleted(self):
+        """Миниатюры sorl старого файла удаляются вместе с ним."""
+        for post in Post.objects.all():
+            get_thumbnail(post.image, '20x10')
+        self.assertTrue(KVStore.objects.exists())
+        self.dedupe()
+        name = Post.objects.values_list('image', flat=True).first()
+        self.assertEqual(media_files(), [name])
+        self.assertFalse(KVStore.objects.exists())
+
+    def test_missing_file_skipped(self):
+        """Пост с потерянным файлом не ломает перенос остальных."""
+        Post.objects.create(author=self.user, text='Без файла',
+                            image='posts/lost.png')
+        output = self.dedupe()
+        self.assertIn('не найдено 1', output)
+        self.assertTrue(Post.objects.filter(image='posts/lost.png').exists())
@@ -0,0 +1,302 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from posts import thumbnails
+from posts.image_variants import available_formats, create_variants
+from posts.models import Post, PostImageVariant, ThumbnailJob, User
+from posts.templatetags.post_cards import post_cards
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def image_file(name='image.png', size=(50, 50)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Текст',
+                                       image=image_file())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        # Миниатюры из прошлых тестов: sorl кладёт их в cache/.
+        shutil.rmtree(os.path.join(TEMP_MEDIA_ROOT, 'cache'),
+                      ignore_errors=True)
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def thumbnail_path(self):
+        thumbnail = thumbnails.thumbnail_file(self.post.image, 'card')
+        return os.path.join(TEMP_MEDIA_ROOT, thumbnail.name)
+
+    def test_pending_thumbnail_is_not_generated_inline(self):
+        """Пока миниатюры нет, страницы показывают заглушку."""
+        for url in (reverse('posts:index'),
+                    reverse('posts:post_detail', args=[self.post.pk])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, 'thumbnail-pending')
+        self.assertFalse(os.path.exists(self.thumbnail_path()))
+
+    def test_generated_thumbnail_replaces_placeholder(self):
+        """После фоновой задачи закешированные страницы
+        показывают миниатюру вместо заглушки.
+        """
+        url = reverse('posts:index')
+        self.assertContains(self.client.get(url), 'thumbnail-pending')
+        thumbnails.generate(self.post.pk)
+        self.assertTrue(os.path.exists(self.thumbnail_path()))
+        thumbnail = thumbnails.ready_thumbnail(self.post.image, 'card')
+        self.assertEqual(list(thumbnail.size), [960, 339])
+        response = self.client.get(url)
+        self.assertNotContains(response, 'thumbnail-pending')
+        self.assertContains(response, '/media/posts/variants/')
+
+    def test_create_and_edit_schedule_thumbnails(self):
+        """post_create и post_edit с новой картинкой ставят задачу."""
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.client.post(reverse('posts:post_create'),
+                             {'text': 'Новый пост',
+                              'image': image_file('new.png')})
+            self.client.post(
+                reverse('posts:post_edit', args=[self.post.pk]),
+                {'text': 'Без новой картинки'})
+            self.client.post(
+                reverse('posts:post_edit', args=[self.post.pk]),
+                {'text': 'С новой картинкой',
+                 'image': image_file('edit.png')})
+        scheduled = [call.args[0].text for call in schedule.call_args_list]
+        self.assertEqual(scheduled, ['Новый пост', 'С новой картинкой'])
+
+    def test_job_queue(self):
+        """Задача ставится один раз и удаляется после выполнения."""
+        thumbnails.schedule(self.post)
+        thumbnails.schedule(self.post)
+        self.assertEqual(ThumbnailJob.objects.count(), 1)
+        call_command('thumbnail_worker', '--once', stdout=StringIO())
+        self.assertFalse(ThumbnailJob.objects.exists())
+        self.assertIsNotNone(
+            thumbnails.ready_thumbnail(self.post.image, 'card'))
+        self.assertTrue(self.post.image_variants.exists())
+        # Размеры старого поста без них заполнила задача.
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image_width, 50)
+
+    def test_failed_job_is_retried_later(self):
+        """Упавшая задача откладывается, а не повторяется сразу."""
+        broken = Post.objects.create(author=self.user, text='Без файла',
+                                     image='posts/missing.png')
+        thumbnails.schedule(broken)
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            self.assertEqual(thumbnails.run_pending(), 0)
+        job = ThumbnailJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(thumbnails.run_pending(), 0)
+
+    def test_exhausted_job_is_reported_and_revived(self):
+        """Задача, исчерпавшая попытки, попадает в лог, а страница
+        поста снова ставит её в очередь через FAILED_JOB_RETRY.
+        """
+        broken = Post.objects.create(author=self.user, text='Без файла',
+                                     image='posts/missing.png')
+        thumbnails.schedule(broken)
+        jobs = ThumbnailJob.objects.filter(post=broken)
+        for _ in range(thumbnails.MAX_ATTEMPTS - 1):
+            with self.assertLogs('posts.thumbnails', 'ERROR'):
+                thumbnails.run_pending()
+            jobs.update(run_after=timezone.now())
+        with self.assertLogs('posts.thumbnails', 'ERROR') as logs:
+            thumbnails.run_pending()
+        self.assertIn('не созданы за 3 попыток', logs.output[-1])
+        jobs.update(run_after=timezone.now())
+        self.assertEqual(thumbnails.run_pending(), 0)
+        thumbnails.schedule_missing(broken)
+        self.assertEqual(jobs.get().attempts, thumbnails.MAX_ATTEMPTS)
+        cache.clear()
+        jobs.update(
+            run_after=timezone.now() - thumbnails.FAILED_JOB_RETRY)
+        thumbnails.schedule_missing(broken)
+        self.assertEqual(jobs.get().attempts, 0)
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            thumbnails.run_pending()
+        self.assertEqual(jobs.get().attempts, 1)
+
+    def test_page_queues_missing_thumbnail(self):
+        """Страница ставит задачу для картинки без миниатюры."""
+        self.client.get(reverse('posts:post_detail', args=[self.post.pk]))
+        self.assertTrue(
+            ThumbnailJob.objects.filter(post=self.post).exists())
+
+    def test_generate_thumbnails_command(self):
+        """Команда создаёт недостающие миниатюры."""
+        call_command('generate_thumbnails', stdout=StringIO())
+        self.assertIsNotNone(
+            thumbnails.ready_thumbnail(self.post.image, 'card'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPrefetchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Пост {num}',
+                 image=f'posts/image{num}.png')
+            for num in range(10))
+        cls.post = Post.objects.create(author=cls.user, text='Готовый',
+                                       image=image_file('ready.png'))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_page_thumbnails_in_one_query(self):
+        """Варианты и миниатюры всех карточек страницы
+        ищутся одним запросом каждые.
+        """
+        thumbnails.generate(self.post.pk)
+        cache.clear()
+        posts = list(Post.objects.for_feed())
+        with CaptureQueriesContext(connection) as queries:
+            cards = post_cards(posts)
+        for table in ('thumbnail_kvstore', 'posts_postimagevariant'):
+            with self.subTest(table=table):
+                self.assertEqual(
+                    sum(table in query['sql'] for query in queries), 1)
+        stem = os.path.splitext(os.path.basename(self.post.image.name))[0]
+        self.assertIn(f'/media/posts/variants/{stem}-50.jpg', cards[0])
+        self.assertEqual(
+            sum('thumbnail-pending' in card for card in cards), 10)
+
+    def test_prefetch_matches_single_lookups(self):
+        """prefetch находит то же, что и поштучный поиск."""
+        thumbnails.generate(self.post.pk)
+        PostImageVariant.objects.all().delete()
+        posts = list(Post.objects.all())
+        thumbnails.prefetch(posts)
+        for post in posts:
+            with self.subTest(post=post.text):
+                single = thumbnails.ready_thumbnail(post.image, 'card')
+                prefetched = post.prefetched_thumbnails['card']
+                self.assertEqual(prefetched and prefetched.name,
+                                 single and single.name)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageVariantTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user, text='Текст',
+            image=image_file('large.png', size=(1000, 500)))
+
+    def test_variants_for_every_width_and_format(self):
+        """Варианты создаются для каждой ширины и доступного формата."""
+        variants = create_variants(self.post)
+        self.assertEqual(
+            sorted((variant.width, variant.height, variant.format)
+                   for variant in variants),
+            sorted((width, height, fmt)
+                   for width, height in ((320, 113), (640, 226), (960, 339))
+                   for fmt in available_formats()))
+        for variant in variants:
+            with self.subTest(variant=str(variant)):
+                self.assertEqual(variant.image.size, variant.size)
+
+    @override_settings(POSTS_IMAGE_FORMATS=('UNKNOWN', 'JPEG'))
+    def test_unsupported_formats_skipped(self):
+        """Форматы, которые Pillow не умеет сохранять, пропускаются."""
+        variants = create_variants(self.post)
+        self.assertEqual({variant.format for variant in variants}, {'JPEG'})
+
+    def test_new_image_replaces_variants(self):
+        """Новые варианты заменяют старые вместе с файлами."""
+        create_variants(self.post)
+        variants = create_variants(self.post)
+        self.assertEqual(self.post.image_variants.count(), len(variants))
+        stem = os.path.splitext(os.path.basename(self.post.image.name))[0]
+        directory = os.path.join(TEMP_MEDIA_ROOT, 'posts', 'variants')
+        files = [name for name in os.listdir(directory)
+                 if name.startswith(f'{stem}-')]
+        self.assertEqual(len(files), len(variants))
+
+    def test_picture_with_srcset(self):
+        """Карточка выводит <picture> с srcset и ленивой загрузкой."""
+        create_variants(self.post)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'loading="lazy"')
+        for width in (320, 640, 960):
+            self.assertContains(response, f'.jpg {width}w')
+        for fmt in set(available_formats()) - {'JPEG'}:
+            self.assertContains(response, f'type="image/{fmt.lower()}"')
+
+    def test_image_change_drops_variants(self):
+        """Новая или удалённая картинка убирает старые варианты:
+        до появления новых карточка показывает миниатюру.
+        """
+        client = Client()
+        client.force_login(self.user)
+        edit_url = reverse('posts:post_edit', args=[self.post.pk])
+        detail_url = reverse('posts:post_detail', args=[self.post.pk])
+        changes = {
+            'new image': {'text': 'Текст', 'image': image_file('new.png')},
+            'cleared image': {'text': 'Текст', 'image-clear': 'on'},
+        }
+        for change, data in changes.items():
+            with self.subTest(change=change):
+                self.post.refresh_from_db()
+                old = [variant.image.name
+                       for variant in create_variants(self.post)]
+                client.post(edit_url, data)
+                self.assertFalse(self.post.image_variants.exists())
+                response = client.get(detail_url)
+                self.assertNotContains(response, '<picture>')
+                for name in old:
+                    self.assertNotContains(response, name)
+            self.post.image = image_file('large.png', size=(1000, 500))
+            self.post.save()
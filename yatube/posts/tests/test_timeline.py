@@ -0,0 +1,84 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Follow, Post, TimelineEntry, User
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def follow_feed(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_new_post_fanned_out_to_followers(self):
+        """Новый пост попадает в ленту каждого подписчика."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post, pub_date=post.pub_date).exists())
+        self.assertEqual(self.follow_feed(), [post])
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        """Подписка переносит старые посты в ленту, отписка убирает их."""
+        old_post = Post.objects.create(author=self.author, text='Старый пост')
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}))
+        self.assertEqual(self.follow_feed(), [old_post])
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}))
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_popular_author_merged_on_read(self):
+        """Посты популярного автора не раскладываются,
+        а подмешиваются в ленту при чтении.
+        """
+        other_reader = User.objects.create_user(username='other')
+        Follow.objects.create(user=other_reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        regular = User.objects.create_user(username='regular')
+        Follow.objects.create(user=self.reader, author=regular)
+        popular_post = Post.objects.create(author=self.author,
+                                           text='Популярный пост')
+        regular_post = Post.objects.create(author=regular, text='Обычный пост')
+        self.assertFalse(TimelineEntry.objects.filter(
+            post=popular_post).exists())
+        self.assertEqual(self.follow_feed(), [regular_post, popular_post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_popular_author_stays_popular(self):
+        """Автор, чьи посты не раскладывались, остаётся популярным,
+        когда подписчиков становится меньше: иначе эти посты пропали
+        бы из ленты.
+        """
+        other_reader = User.objects.create_user(username='other')
+        Follow.objects.create(user=other_reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        popular_post = Post.objects.create(author=self.author,
+                                           text='Популярный пост')
+        Follow.objects.filter(user=other_reader).delete()
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_feed(), [new_post, popular_post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_follow_feed_reads_follower_counters(self):
+        """Популярность авторов берётся из счётчиков подписчиков,
+        без GROUP BY по подпискам.
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.follow_feed()
+        with CaptureQueriesContext(connection) as queries:
+            self.follow_feed()
+        for query in queries:
+            self.assertNotIn('GROUP BY', query['sql'])
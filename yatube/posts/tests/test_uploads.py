@@ -0,0 +1,160 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from posts.forms import PostForm
+from posts.image_variants import EXIF_ORIENTATION
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Полное декодирование 3000x2000 заняло бы 2 * 24 МБ.
+MEMORY_LIMIT = 8 * 1024 * 1024
+
+
+def upload(size, fmt='JPEG', name='photo.jpg', exif=None, **options):
+    buffer = BytesIO()
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    if exif is not None:
+        options['exif'] = exif
+    image.save(buffer, fmt, **options)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+def rotated_exif():
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    exif[0x010F] = 'Camera'
+    return exif.tobytes()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_UPLOAD_MAX_SIDE=600,
+                   POSTS_UPLOAD_MEMORY_LIMIT=MEMORY_LIMIT)
+class PostImageUploadTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def form(self, image):
+        return PostForm(data={'text': 'Текст'}, files={'image': image})
+
+    def saved_image(self, form):
+        self.assertTrue(form.is_valid(), form.errors)
+        image = form.cleaned_data['image']
+        image.seek(0)
+        return Image.open(BytesIO(image.read()))
+
+    def test_large_jpeg_downsampled_in_draft_mode(self):
+        """Большой JPEG уменьшается, укладываясь в лимит памяти,
+        которого не хватило бы на полное декодирование.
+        """
+        image = self.saved_image(self.form(upload((3000, 2000))))
+        self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(image.size, (600, 400))
+
+    def test_large_png_over_memory_limit(self):
+        """PNG не декодируется в уменьшенном масштабе: если он
+        не помещается в лимит памяти, форма его не принимает.
+        """
+        form = self.form(upload((3000, 2000), 'PNG', 'photo.png'))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'too_much_memory')
+
+    def test_png_memory_limit_in_pixels(self):
+        """Предел для PNG - около POSTS_UPLOAD_MEMORY_LIMIT / 5 пикселей:
+        при 8 МБ это 1.6 Мпикс.
+        """
+        form = self.form(upload((1400, 1000), 'PNG', 'photo.png'))
+        self.assertTrue(form.is_valid(), form.errors)
+        form = self.form(upload((1500, 1200), 'PNG', 'photo.png'))
+        self.assertFalse(form.is_valid())
+        error = form.errors.as_data()['image'][0]
+        self.assertEqual(error.code, 'too_much_memory')
+        self.assertEqual(error.params['limit'], 1.7)
+
+    @override_settings(POSTS_UPLOAD_MAX_SIDE=2560,
+                       POSTS_UPLOAD_MEMORY_LIMIT=64 * 1024 * 1024)
+    def test_common_png_within_default_limit(self):
+        """Обычный PNG 4000x3000 укладывается в лимит по умолчанию."""
+        image = self.saved_image(
+            self.form(upload((4000, 3000), 'PNG', 'photo.png')))
+        self.assertEqual(image.format, 'PNG')
+        self.assertEqual(image.size, (2560, 1920))
+
+    def test_large_animated_gif_rejected(self):
+        """Анимацию не уменьшаем: от неё остался бы первый кадр."""
+        frames = [Image.new('P', (900, 600), color) for color in (1, 2)]
+        buffer = BytesIO()
+        frames[0].save(buffer, 'GIF', save_all=True,
+                       append_images=frames[1:])
+        form = self.form(SimpleUploadedFile('anim.gif', buffer.getvalue()))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code, 'animated')
+
+    def test_small_animated_gif_kept(self):
+        """Небольшая анимация сохраняется со всеми кадрами."""
+        frames = [Image.new('P', (90, 60), color) for color in (1, 2)]
+        buffer = BytesIO()
+        frames[0].save(buffer, 'GIF', save_all=True,
+                       append_images=frames[1:])
+        image = self.saved_image(
+            self.form(SimpleUploadedFile('anim.gif', buffer.getvalue())))
+        self.assertEqual(image.n_frames, 2)
+
+    @override_settings(POSTS_UPLOAD_MAX_PIXELS=1_000_000)
+    def test_pixel_count_checked_before_decoding(self):
+        """Число пикселей проверяется по заголовку, без декодирования."""
+        form = self.form(upload((1500, 1000), 'PNG', 'photo.png'))
+        with mock.patch.object(Image.Image, 'load',
+                               side_effect=AssertionError('decoded')):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'too_many_pixels')
+
+    @override_settings(POSTS_UPLOAD_MAX_SIZE=1000)
+    def test_file_size_limit(self):
+        """Слишком большой файл отклоняется."""
+        form = self.form(upload((300, 200)))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'file_too_large')
+
+    def test_exif_applied_and_stripped(self):
+        """Поворот из EXIF применяется, сам EXIF удаляется."""
+        image = self.saved_image(
+            self.form(upload((300, 200), exif=rotated_exif())))
+        self.assertEqual(image.size, (200, 300))
+        self.assertNotIn('exif', image.info)
+
+    def test_png_exif_stripped(self):
+        """EXIF без поворота тоже удаляется, в том числе из PNG."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        image = self.saved_image(self.form(
+            upload((300, 200), 'PNG', 'photo.png', exif=exif.tobytes())))
+        self.assertEqual(image.size, (300, 200))
+        self.assertNotIn('exif', image.info)
+
+    def test_small_image_kept(self):
+        """Небольшая картинка без EXIF сохраняется без перекодирования."""
+        original = upload((300, 200), 'PNG', 'photo.png')
+        content = original.read()
+        original.seek(0)
+        form = self.form(original)
+        self.assertTrue(form.is_valid(), form.errors)
+        image = form.cleaned_data['image']
+        image.seek(0)
+        self.assertEqual(image.read(), content)
+
+    def test_unsupported_format(self):
+        """Форматы не из POSTS_UPLOAD_FORMATS не принимаются."""
+        form = self.form(upload((30, 20), 'BMP', 'photo.bmp'))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'invalid_format')
@@ -1,14 +1,18 @@
 import shutil
 import tempfile
 
-from django.test import Client, TestCase, override_settings
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.template.loader import render_to_string
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
 from django import forms
 
-from posts.models import Post, User, Group, Follow
+from posts.models import Post, User, Group, Follow, Comment
+from posts.views import pagination
 
 TEST_POSTS_NUM = 13
 
@@ -201,21 +205,72 @@ class PostPagesTests(TestCase):
         self.assertNotIn(PostPagesTests.post, some_group_posts)
 
     def test_cache_index_page(self):
-        """Кеширование работает для главной страницы."""
+        """Главная страница кешируется до изменения постов."""
         response = self.authorized_client.get(reverse('posts:index'))
         content_old = response.content
-        first_post = response.context['page_obj'][0]
-        first_post.delete()
+        # update() не отправляет сигналов: страница остаётся в кеше.
+        Post.objects.update(text='Изменённый текст без сигналов')
         response = self.authorized_client.get(reverse('posts:index'))
-        content_new = response.content
-        self.assertEqual(content_old, content_new)
+        self.assertEqual(content_old, response.content)
         cache.clear()
         response = self.authorized_client.get(reverse('posts:index'))
-        content_after_clear = response.content
-        self.assertNotEqual(
-            content_old,
-            content_after_clear
-        )
+        self.assertNotEqual(content_old, response.content)
+
+    def test_post_changes_invalidate_cached_pages(self):
+        """Создание, правка и удаление поста сразу видны на
+        закешированных страницах ленты.
+        """
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': PostPagesTests.user.username}),
+        ]
+        for url in urls:
+            self.guest_client.get(url)
+        new_post = Post.objects.create(author=PostPagesTests.user,
+                                       text='Свежий пост',
+                                       group=self.group)
+        for url in urls:
+            with self.subTest(url=url, action='create'):
+                self.assertContains(self.guest_client.get(url), 'Свежий пост')
+        new_post.text = 'Исправленный пост'
+        new_post.save()
+        for url in urls:
+            with self.subTest(url=url, action='edit'):
+                self.assertContains(self.guest_client.get(url),
+                                    'Исправленный пост')
+        new_post.delete()
+        for url in urls:
+            with self.subTest(url=url, action='delete'):
+                self.assertNotContains(self.guest_client.get(url),
+                                       'Исправленный пост')
+
+    def test_comments_invalidate_cached_pages(self):
+        """Новое число комментариев сразу видно на закешированных
+        страницах ленты.
+        """
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': PostPagesTests.user.username}),
+        ]
+        for url in urls:
+            self.assertNotContains(self.guest_client.get(url),
+                                   'комментариев:')
+        comment = Comment.objects.create(post=PostPagesTests.post,
+                                         author=self.user,
+                                         text='Комментарий')
+        for url in urls:
+            with self.subTest(url=url, action='create'):
+                self.assertContains(self.guest_client.get(url),
+                                    '(комментариев: 1)')
+        comment.delete()
+        for url in urls:
+            with self.subTest(url=url, action='delete'):
+                self.assertNotContains(self.guest_client.get(url),
+                                       'комментариев:')
 
 
 class PaginatorViewsTest(TestCase):
@@ -260,6 +315,202 @@ class PaginatorViewsTest(TestCase):
                                  settings.POSTS_SHOWN)
 
 
+class PageWindowTest(TestCase):
+    def render_paginator(self, posts_num, page):
+        request = RequestFactory().get('/', {'page': page})
+        page_obj = pagination(request, range(posts_num))
+        return render_to_string('includes/paginator.html',
+                                {'page_obj': page_obj})
+
+    def test_page_window(self):
+        """В окне первые, последние и соседние с текущей страницы."""
+        request = RequestFactory().get('/', {'page': 50})
+        page_obj = pagination(request, range(1000))
+        self.assertEqual(
+            page_obj.page_window,
+            [1, 2, '…', 47, 48, 49, 50, 51, 52, 53, '…', 99, 100])
+
+    def test_paginator_html_does_not_grow(self):
+        """Число ссылок навигации не растёт с числом постов.
+        Время отрисовки меряет команда bench_paginator.
+        """
+        sizes = {
+            posts_num: self.render_paginator(
+                posts_num, posts_num // 20).count('<li')
+            for posts_num in (1000, 200000, 2000000)
+        }
+        self.assertEqual(len(set(sizes.values())), 1, sizes)
+
+
+@override_settings(POSTS_KEYSET_PAGINATION=True)
+class KeysetPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create([
+            Post(
+                author=cls.user,
+                text=f'Тестовый пост {post_num}',
+                group=cls.group,
+            )
+            for post_num in range(TEST_POSTS_NUM)
+        ])
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_keyset_pages_cover_feed(self):
+        """Курсоры ?after=/?before= обходят ленту без пропусков."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': KeysetPaginatorViewsTest.user}),
+        ]
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url).context['page_obj']
+                self.assertEqual(len(first), settings.POSTS_SHOWN)
+                self.assertFalse(first.has_previous())
+                self.assertTrue(first.has_next())
+                second = self.guest_client.get(
+                    url, {'after': first.next_cursor()}
+                ).context['page_obj']
+                self.assertEqual(list(first) + list(second), expected)
+                self.assertFalse(second.has_next())
+                back = self.guest_client.get(
+                    url, {'before': second.previous_cursor()}
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+
+    def test_keyset_page_skips_count(self):
+        """Keyset-страница не выполняет COUNT(*)."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url)
+        self.assertContains(response, '?after=')
+        self.assertNotContains(response, '?page=')
+        for query in queries:
+            self.assertNotIn('__count"', query['sql'])
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        """Битый курсор открывает первую страницу."""
+        response = self.guest_client.get(reverse('posts:index'),
+                                         {'after': '%%%'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for num in range(TEST_POSTS_NUM):
+            author = User.objects.create_user(username=f'author_{num}',
+                                              first_name='Имя',
+                                              last_name='Фамилия')
+            Follow.objects.create(user=cls.reader, author=author)
+            post = Post.objects.create(author=author,
+                                       text=f'Тестовый пост {num}',
+                                       group=cls.group)
+            Comment.objects.create(post=post, author=cls.reader,
+                                   text='Комментарий')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(FeedQueriesTest.reader)
+        cache.clear()
+
+    def test_feed_pages_have_fixed_query_budget(self):
+        """Число запросов ленты не зависит от числа постов на странице:
+        сессия, пользователь, счётчик и сама страница, а у страниц
+        групп и профилей ещё признак свежести (posts.freshness).
+        """
+        budgets = {
+            reverse('posts:index'): 4,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}): 6,
+            reverse('posts:profile', kwargs={'username': 'author_0'}): 7,
+            reverse('posts:follow_index'): 6,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url)
+                self.assertContains(response, 'Имя Фамилия')
+
+    def test_feed_posts_have_comment_count(self):
+        """Карточки ленты получают число комментариев аннотацией."""
+        response = self.client.get(reverse('posts:index'))
+        for post in response.context['page_obj']:
+            self.assertEqual(post.comment_count, 1)
+
+
+class PostDetailQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author',
+                                              first_name='Имя',
+                                              last_name='Фамилия')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(author=cls.author, text='Пост',
+                                       group=cls.group)
+        Post.objects.create(author=cls.author, text='Второй пост')
+        for num in range(3):
+            Comment.objects.create(post=cls.post, author=cls.author,
+                                   text=f'Комментарий {num}')
+        cls.url = reverse('posts:post_detail',
+                          kwargs={'post_id': cls.post.pk})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_budget(self):
+        """Признак свежести, пост с автором и группой одним запросом
+        и комментарии; число постов автора - из кеша счётчиков.
+        """
+        self.client.get(self.url)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Имя Фамилия')
+        self.assertContains(response, self.group.title)
+        self.assertEqual(response.context['posts_per_auth'], 2)
+        self.assertEqual(len(response.context['comments']), 3)
+
+    def test_cold_counter_budget(self):
+        """Без кеша числа комментариев и постов автора читаются
+        из Counter одним запросом.
+        """
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['posts_per_auth'], 2)
+
+    def test_author_budget(self):
+        """Автору добавляются только сессия и пользователь."""
+        self.client.force_login(self.author)
+        self.client.get(self.url)
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'редактировать запись')
+
+
 class FollowViewsTests(TestCase):
     def setUp(self):
         self.auth_follower = Client()
@@ -295,6 +546,35 @@ class FollowViewsTests(TestCase):
         self.assertFalse(Follow.objects.filter(
             author=self.user_following, user=self.user_follower).exists())
 
+    def test_follow_invalidates_both_profiles(self):
+        """Закешированные профили автора и подписчика сразу показывают
+        новые числа подписчиков и подписок, в том числе при условном GET.
+        """
+        cache.clear()
+        urls = {
+            'author': reverse('posts:profile', kwargs={
+                'username': self.user_following.username}),
+            'follower': reverse('posts:profile', kwargs={
+                'username': self.user_follower.username}),
+        }
+        responses = {name: self.auth_other_user.get(url)
+                     for name, url in urls.items()}
+        self.auth_follower.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': self.user_following.username}))
+        expected = {'author': 'Подписчиков: 1, подписок: 0',
+                    'follower': 'Подписчиков: 0, подписок: 1'}
+        for name, url in urls.items():
+            with self.subTest(profile=name):
+                response = self.auth_other_user.get(
+                    url, HTTP_IF_NONE_MATCH=responses[name]['ETag'])
+                self.assertContains(response, expected[name])
+        self.auth_follower.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.user_following.username}))
+        response = self.auth_other_user.get(urls['follower'])
+        self.assertContains(response, 'Подписчиков: 0, подписок: 0')
+
     def test_new_post_on_correct_page(self):
         """Новая запись пользователя появляется в
         ленте тех, кто на него подписан, и не появляется
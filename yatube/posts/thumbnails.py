@@ -0,0 +1,227 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import F, prefetch_related_objects
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore
+
+from core.cache import LOCK_KEY, bump_generations
+
+from .image_variants import create_variants, describe_image
+from .models import Post, ThumbnailJob
+from .signals import bump_post_pages
+
+logger = logging.getLogger(__name__)
+
+# Шаблон проверяет очередь для поста без миниатюры не чаще
+# раза в PENDING_TIMEOUT.
+PENDING_KEY = LOCK_KEY.format('thumbnails:{}')
+PENDING_TIMEOUT = 10 * 60
+
+# Сколько раз пробовать задачу и через сколько её повторять,
+# если обработчик не ответил.
+MAX_ATTEMPTS = 3
+THUMBNAIL_JOB_LEASE = timedelta(minutes=10)
+# Через сколько после последней попытки schedule_missing снова
+# запускает задачу, исчерпавшую MAX_ATTEMPTS.
+FAILED_JOB_RETRY = timedelta(hours=1)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.POSTS_THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails')
+    return _executor
+
+
+def thumbnail_file(image, name):
+    """Файл миниатюры name картинки image, ещё не созданный.
+    Повторяет ThumbnailBackend.get_thumbnail до генерации.
+    """
+    geometry, options = settings.POSTS_THUMBNAILS[name]
+    backend = default.backend
+    source = ImageFile(image)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return ImageFile(
+        backend._get_thumbnail_filename(source, geometry, options),
+        default.storage)
+
+
+def ready_thumbnail(image, name):
+    """Готовая миниатюра из хранилища ключей sorl или None."""
+    return ready_thumbnails([(image, name)])[image.name, name]
+
+
+def ready_thumbnails(pairs):
+    """Готовые миниатюры для пар (картинка, имя миниатюры):
+    {(имя файла картинки, имя миниатюры): ImageFile или None}.
+
+    Хранилище sorl спрашивается одним get_many к кешу, а промахи -
+    одним запросом к его таблице, а не по запросу на миниатюру.
+    """
+    files = {(image.name, name): thumbnail_file(image, name)
+             for image, name in pairs}
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBStore):
+        return {pair: kvstore.get(file) for pair, file in files.items()}
+    keys = {pair: add_prefix(file.key) for pair, file in files.items()}
+    values = kvstore.cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in values]
+    if missing:
+        fresh = dict.fromkeys(missing, EMPTY_VALUE)
+        fresh.update(KVStore.objects.filter(key__in=missing)
+                     .values_list('key', 'value'))
+        # Отсутствие тоже кешируется, как в самом sorl:
+        # _set_raw перезапишет его, когда миниатюра появится.
+        kvstore.cache.set_many(fresh, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fresh)
+    return {
+        pair: (None if values[key] == EMPTY_VALUE
+               else deserialize_image_file(values[key]))
+        for pair, key in keys.items()
+    }
+
+
+def prefetch(posts):
+    """Загружает варианты картинок постов страницы одним запросом,
+    а для постов без вариантов разом находит миниатюры и запоминает
+    их в post.prefetched_thumbnails для {% post_thumbnail %}.
+    """
+    posts = [post for post in posts if post.image]
+    prefetch_related_objects(posts, 'image_variants')
+    posts = [post for post in posts if not post.image_variants.all()]
+    if not posts:
+        return
+    found = ready_thumbnails([(post.image, name) for post in posts
+                              for name in settings.POSTS_THUMBNAILS])
+    for post in posts:
+        post.prefetched_thumbnails = {
+            name: found[post.image.name, name]
+            for name in settings.POSTS_THUMBNAILS
+        }
+
+
+def generate(post_id):
+    """Создаёт все миниатюры POSTS_THUMBNAILS и варианты для srcset
+    картинки поста и сбрасывает страницы, где вместо них была заглушка.
+    """
+    post = (Post.objects.select_related('author', 'group')
+            .filter(pk=post_id).first())
+    if post is None or not post.image:
+        return
+    if post.image_width is None:
+        # Пост загружен до того, как PostForm стал запоминать размеры.
+        with post.image.open('rb') as file:
+            Post.objects.filter(pk=post.pk).update(**describe_image(file))
+    for geometry, options in settings.POSTS_THUMBNAILS.values():
+        get_thumbnail(post.image, geometry, **options)
+    create_variants(post)
+    # Вместо заглушки на странице поста теперь картинка: сдвигаем
+    # её Last-Modified.
+    Post.objects.filter(pk=post.pk).update(updated=timezone.now())
+    bump_post_pages(post, post.group and post.group.slug)
+    bump_generations(f'card:post:{post.pk}')
+
+
+def run_pending(limit=None):
+    """Выполняет задачи ThumbnailJob, пока они есть (не больше limit).
+
+    Задача захватывается условным UPDATE и откладывается на
+    THUMBNAIL_JOB_LEASE: её не возьмёт другой обработчик, а если этот
+    упадёт, она повторится позже. Успешная задача удаляется, если её
+    не поставили заново, пока она выполнялась.
+    """
+    done = 0
+    while limit is None or done < limit:
+        now = timezone.now()
+        job = (ThumbnailJob.objects
+               .filter(run_after__lte=now, attempts__lt=MAX_ATTEMPTS)
+               .first())
+        if job is None:
+            break
+        claimed = ThumbnailJob.objects.filter(
+            pk=job.pk, attempts=job.attempts, run_after=job.run_after,
+        ).update(attempts=F('attempts') + 1,
+                 run_after=now + THUMBNAIL_JOB_LEASE)
+        if not claimed:
+            continue
+        try:
+            generate(job.post_id)
+        except Exception:
+            logger.exception('Не удалось создать миниатюры поста %s',
+                             job.post_id)
+            if job.attempts + 1 >= MAX_ATTEMPTS:
+                logger.error(
+                    'Миниатюры поста %s не созданы за %s попыток: '
+                    'задача отложена до запроса страницы не раньше '
+                    'чем через %s', job.post_id, MAX_ATTEMPTS,
+                    FAILED_JOB_RETRY)
+            continue
+        ThumbnailJob.objects.filter(
+            pk=job.pk, attempts=job.attempts + 1).delete()
+        done += 1
+    return done
+
+
+def _run_in_thread():
+    try:
+        run_pending()
+    finally:
+        # Соединения потока с базой иначе остались бы открытыми.
+        connections.close_all()
+
+
+def _wake_workers():
+    if settings.POSTS_THUMBNAIL_WORKERS:
+        transaction.on_commit(
+            lambda: _get_executor().submit(_run_in_thread))
+
+
+def schedule(post):
+    """Ставит создание миниатюр и вариантов картинки поста в очередь.
+    Задача сохраняется в той же транзакции, что и пост.
+    """
+    if not post.image:
+        return
+    ThumbnailJob.objects.update_or_create(
+        post=post, defaults={'attempts': 0, 'run_after': timezone.now()})
+    _wake_workers()
+
+
+def schedule_missing(post):
+    """Ставит задачу для картинки без миниатюры, если её ещё нет:
+    например, для постов, загруженных до появления очереди. Задача,
+    исчерпавшая попытки, запускается заново через FAILED_JOB_RETRY.
+    """
+    if not cache.add(PENDING_KEY.format(post.pk), 1, PENDING_TIMEOUT):
+        return
+    job, created = ThumbnailJob.objects.get_or_create(post=post)
+    now = timezone.now()
+    if created or ThumbnailJob.objects.filter(
+        pk=job.pk, attempts__gte=MAX_ATTEMPTS,
+        run_after__lte=now - FAILED_JOB_RETRY,
+    ).update(attempts=0, run_after=now):
+        _wake_workers()
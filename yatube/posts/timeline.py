@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.db.models import Q
+
+from . import counts
+from .models import Counter, Follow, Post, TimelineEntry
+
+
+def popular_author_ids(author_ids):
+    """Авторы, у которых подписчиков больше TIMELINE_FANOUT_LIMIT:
+    их посты не раскладываются по лентам, а подмешиваются при чтении.
+    Такой автор получает отметку Counter.POPULAR_AUTHOR и остаётся
+    популярным навсегда: иначе, когда подписчиков снова станет меньше,
+    пропущенные при раскладке посты пропали бы из лент.
+    """
+    popular = []
+    for pk, (followers, flagged) in counts.follower_counts(
+            list(author_ids)).items():
+        if followers > settings.TIMELINE_FANOUT_LIMIT and not flagged:
+            counts.increment(Counter.POPULAR_AUTHOR, pk)
+            flagged = True
+        if flagged:
+            popular.append(pk)
+    return popular
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if popular_author_ids([post.author_id]):
+        return
+    user_ids = (Follow.objects.filter(author_id=post.author_id)
+                .values_list('user_id', flat=True).iterator())
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in user_ids),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Переносит в ленту подписчика последние посты нового автора."""
+    if popular_author_ids([author_id]):
+        return
+    posts = (Post.objects.filter(author_id=author_id)
+             .values_list('pk', 'pub_date')
+             [:settings.TIMELINE_BACKFILL])
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора, от которого отписались."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def followed_popular_ids(user):
+    """Популярные авторы среди подписок пользователя."""
+    return popular_author_ids(
+        Follow.objects.filter(user=user).values_list('author_id', flat=True))
+
+
+def follow_feed(user, popular_ids=None):
+    """Лента подписок: разложенные посты из TimelineEntry
+    плюс посты популярных авторов, подмешанные при чтении.
+    popular_ids - готовый followed_popular_ids(user).
+    """
+    if popular_ids is None:
+        popular_ids = followed_popular_ids(user)
+    if not popular_ids:
+        # Сортировка по дате из TimelineEntry читает индекс
+        # timeline_user_pub_date без отдельной сортировки постов.
+        return (Post.objects.filter(timeline_entries__user=user)
+                .order_by('-timeline_entries__pub_date'))
+    timeline = TimelineEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(
+        Q(pk__in=timeline) | Q(author_id__in=popular_ids))
@@ -0,0 +1,112 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+# Pillow хранит пиксель в 4 байтах, кроме режимов с одним байтом.
+SINGLE_BYTE_MODES = ('1', 'L', 'P')
+
+
+def check_size(file):
+    """Ограничение на размер загруженного файла в байтах."""
+    if file.size > settings.POSTS_UPLOAD_MAX_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)s.', code='file_too_large',
+            params={'limit': filesizeformat(settings.POSTS_UPLOAD_MAX_SIZE)})
+
+
+def target_size(width, height):
+    """Размер уменьшенного оригинала: не больше POSTS_UPLOAD_MAX_SIDE
+    по каждой стороне, пропорция та же.
+    """
+    scale = min(1, settings.POSTS_UPLOAD_MAX_SIDE / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def bytes_per_pixel(image):
+    return 1 if image.mode in SINGLE_BYTE_MODES else 4
+
+
+def decoded_size(image):
+    """Память на обработку: декодированная картинка и её копия,
+    уменьшенная reduce() внутри thumbnail() - не больше четверти.
+    Поворот по EXIF делается уже после уменьшения.
+    """
+    width, height = image.size
+    return width * height * bytes_per_pixel(image) * 5 // 4
+
+
+def max_decoded_pixels(image):
+    """Сколько пикселей помещается в POSTS_UPLOAD_MEMORY_LIMIT: для
+    PNG, GIF и WebP при 64 МБ это около 13 Мпикс (4000x3000), JPEG
+    декодируется уменьшенным и упирается только в POSTS_UPLOAD_MAX_PIXELS.
+    """
+    return (settings.POSTS_UPLOAD_MEMORY_LIMIT * 4
+            // (5 * bytes_per_pixel(image)))
+
+
+def prepare_image(file):
+    """Проверяет загруженную картинку по заголовку и готовит её
+    к сохранению. Возвращает file как есть, если он не больше
+    POSTS_UPLOAD_MAX_SIDE и без EXIF, иначе новый файл: уменьшенный,
+    повёрнутый по EXIF и без него (в EXIF бывают координаты съёмки).
+    """
+    file.seek(0)
+    # Image.open читает только заголовок: пиксели ещё не декодированы.
+    image = Image.open(file)
+    fmt = image.format
+    if fmt not in settings.POSTS_UPLOAD_FORMATS:
+        raise ValidationError(
+            'Формат %(format)s не поддерживается.', code='invalid_format',
+            params={'format': fmt})
+    width, height = image.size
+    if width * height > settings.POSTS_UPLOAD_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка %(width)sx%(height)s больше %(limit)s Мпикс.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height,
+                    'limit': settings.POSTS_UPLOAD_MAX_PIXELS // 10 ** 6})
+    target = target_size(width, height)
+    # EXIF смотрим в info: getexif() у PNG декодирует всю картинку.
+    if target == image.size and 'exif' not in image.info:
+        file.seek(0)
+        return file
+    if getattr(image, 'is_animated', False):
+        # Перекодирование оставило бы только первый кадр.
+        raise ValidationError(
+            'Анимированная картинка должна быть не больше %(side)s пикселей '
+            'по каждой стороне и без EXIF.', code='animated',
+            params={'side': settings.POSTS_UPLOAD_MAX_SIDE})
+    # JPEG декодируется сразу в масштабе 1/2-1/8, не меньше target.
+    image.draft(image.mode, target)
+    if decoded_size(image) > settings.POSTS_UPLOAD_MEMORY_LIMIT:
+        raise ValidationError(
+            'Картинка %(width)sx%(height)s слишком большая для обработки, '
+            'уменьшите её до %(limit)s Мпикс.', code='too_much_memory',
+            params={'width': width, 'height': height,
+                    'limit': round(max_decoded_pixels(image) / 10 ** 6, 1)})
+    icc_profile = image.info.get('icc_profile')
+    # Сначала уменьшаем, потом поворачиваем: exif_transpose копирует
+    # картинку. Рамка квадратная, поэтому результат тот же.
+    max_side = settings.POSTS_UPLOAD_MAX_SIDE
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    image = ImageOps.exif_transpose(image)
+    # PNG сохраняет EXIF из info, если его нет в параметрах save().
+    image.info.pop('exif', None)
+    options = {}
+    if fmt in ('JPEG', 'WEBP'):
+        options['quality'] = settings.POSTS_UPLOAD_QUALITY
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    buffer = BytesIO()
+    image.save(buffer, fmt, **options)
+    name = os.path.splitext(os.path.basename(file.name))[0]
+    return SimpleUploadedFile(f'{name}.{EXTENSIONS[fmt]}', buffer.getvalue(),
+                              content_type=Image.MIME[fmt])
@@ -1,34 +1,67 @@
+from functools import partial
+from urllib.parse import urlencode
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-from django.core.paginator import Paginator
+
+from core.cache import (cache_page_generations, conditional_page,
+                        generation_key)
 
 from .models import Post, Group, User, Follow, Comment
 from .forms import PostForm, CommentForm
+from .paginators import KeysetPaginator, WindowedPaginator
+from .search import SearchPaginator
+from . import counts, thumbnails, timeline
+from .freshness import group_freshness, post_freshness, profile_freshness
 
 from django.conf import settings
 
 
-def pagination(request, post_objs):
-    paginator = Paginator(post_objs, settings.POSTS_SHOWN)
+def pagination(request, post_objs, keyset=None, count=None):
+    """Страница ленты. Keyset-режим включается параметром keyset,
+    настройкой POSTS_KEYSET_PAGINATION или курсором ?after=/?before=
+    в запросе; иначе обычная паджинация по номеру страницы,
+    count - число записей из posts.counts вместо COUNT(*)
+    или функция, которая его вернёт (keyset-режиму число не нужно).
+    """
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if keyset is None:
+        keyset = (settings.POSTS_KEYSET_PAGINATION
+                  or after is not None or before is not None)
+    if keyset:
+        paginator = KeysetPaginator(post_objs, settings.POSTS_SHOWN)
+        return paginator.get_page(after=after, before=before)
+    if callable(count):
+        count = count()
+    paginator = WindowedPaginator(post_objs, settings.POSTS_SHOWN,
+                                  count=count)
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    page_obj = paginator.get_page(page_number)
+    page_obj.page_window = list(paginator.get_elided_page_range(
+        page_obj.number, on_each_side=settings.POSTS_PAGE_WINDOW))
+    return page_obj
 
 
-@cache_page(20, key_prefix='index_page')
+@cache_page_generations(settings.POSTS_PAGE_CACHE_TIMEOUT, 'index')
 def index(request):
-    posts = Post.objects.select_related('group').all()
-    page_obj = pagination(request, posts)
+    posts = Post.objects.for_feed()
+    page_obj = pagination(request, posts, count=counts.all_post_count)
     context = {
         'page_obj': page_obj,
+        'cache_timeout': settings.POSTS_PAGE_CACHE_TIMEOUT,
+        'cache_generation': generation_key(['index']),
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page(group_freshness)
+@cache_page_generations(settings.POSTS_PAGE_CACHE_TIMEOUT, 'group:{slug}')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = pagination(request, posts)
+    posts = group.posts.for_feed()
+    page_obj = pagination(request, posts,
+                          count=partial(counts.group_post_count, group))
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -36,27 +69,51 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page(profile_freshness)
+@cache_page_generations(settings.POSTS_PAGE_CACHE_TIMEOUT,
+                        'profile:{username}')
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    page_obj = pagination(request, author.posts.all())
+    posts_count, followers_count, following_count = (
+        counts.user_counts(author))
+    page_obj = pagination(request, author.posts.for_feed(),
+                          count=posts_count)
     following = (request.user.is_authenticated
                  and author != request.user
                  and Follow.objects.filter(user=request.user,
                                            author=author).exists())
     context = {
         'author': author,
+        'posts_count': posts_count,
+        'followers_count': followers_count,
+        'following_count': following_count,
         'page_obj': page_obj,
         'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def comments_page(post_id, after=None):
+    """Страница комментариев поста от новых к старым по курсору after,
+    авторы тем же запросом.
+    """
+    comments = (Comment.objects.filter(post_id=post_id)
+                .select_related('author')
+                .only('text', 'pub_date', 'post_id', 'author__username'))
+    return KeysetPaginator(comments, settings.POSTS_COMMENTS_SHOWN).get_page(
+        after=after)
+
+
+@conditional_page(post_freshness)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    # Обращение через related_name, чтобы не иcпользовать фильтр
-    posts_per_auth = post.author.posts.count()
+    """Страница поста: пост с автором и группой одним запросом,
+    число постов автора из posts.counts и один запрос комментариев.
+    """
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
+    posts_per_auth = counts.author_post_count(post.author)
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = comments_page(post.pk, request.GET.get('after'))
     context = {
         'post': post,
         'posts_per_auth': posts_per_auth,
@@ -66,6 +123,18 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующая страница комментариев HTML-фрагментом
+    для кнопки «Показать ещё».
+    """
+    post = get_object_or_404(Post.objects.only('author_id'), pk=post_id)
+    context = {
+        'post': post,
+        'comments': comments_page(post.pk, request.GET.get('after')),
+    }
+    return render(request, 'includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None,
@@ -75,6 +144,7 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post)
         return redirect('posts:profile', post.author.username)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -90,6 +160,8 @@ def post_edit(request, post_id):
         instance=post)
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id=post.id)
     return render(request, 'posts/create_post.html', {'form': form,
                                                       'post': post,
@@ -108,10 +180,32 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def search(request):
+    """Поиск по текстам постов и комментариев, лучшие совпадения
+    первыми; страницы по курсору, как у ленты в keyset-режиме.
+    """
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        paginator = SearchPaginator(query, Post.objects.for_feed(),
+                                    settings.POSTS_SHOWN)
+        page_obj = paginator.get_page(after=request.GET.get('after'),
+                                      before=request.GET.get('before'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = pagination(request, posts)
+    popular_ids = timeline.followed_popular_ids(request.user)
+    posts = timeline.follow_feed(request.user, popular_ids).for_feed()
+    page_obj = pagination(request, posts,
+                          count=partial(counts.follow_post_count,
+                                        request.user, popular_ids))
     context = {
         'page_obj': page_obj,
     }
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -25,6 +26,16 @@ SECRET_KEY = '7g3u&fa67z@_6ytcq9&9bb$a#bnket14)zn3qbs%s0&**tsd!x'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Запуск тестов (manage.py test или pytest): им не нужны фоновые потоки
+# и общий кеш
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
+# Кеш (CACHES ниже): 'shared' - общий для всех процессов, 'local' -
+# свой в памяти каждого процесса. Задаётся переменной окружения
+# YATUBE_CACHE, тесты всегда работают с 'local'.
+CACHE_BACKEND = ('local' if TESTING
+                 else os.environ.get('YATUBE_CACHE', 'shared'))
+
 ALLOWED_HOSTS = [
     'localhost',
     '127.0.0.1',
@@ -135,6 +146,79 @@ STATIC_URL = '/static/'
 # Constants for views
 
 POSTS_SHOWN = 10
+# Комментариев на странице поста и в каждой догружаемой порции
+POSTS_COMMENTS_SHOWN = 20
+
+# Лента листается курсорами ?after=/?before= вместо номеров страниц
+POSTS_KEYSET_PAGINATION = False
+# Поиск (posts.search, SQLite FTS5): сколько слов запроса учитывать
+# и вес совпадения в комментарии относительно совпадения в самом посте
+POSTS_SEARCH_MAX_WORDS = 10
+POSTS_SEARCH_COMMENT_WEIGHT = 0.5
+
+# Админка: число записей в отфильтрованном списке считается не дальше
+# этого предела или конца открытой страницы (без фильтров - из счётчиков
+# posts.counts или по наибольшему pk)
+POSTS_ADMIN_COUNT_LIMIT = 10000
+
+# Сколько номеров страниц показывать по бокам от текущей
+POSTS_PAGE_WINDOW = 3
+
+# Сколько секунд хранить счётчики постов (posts.counts)
+POSTS_COUNT_TIMEOUT = 60 * 60
+
+# Сколько хранить страницы лент: сбрасываются поколениями (core.cache)
+# при изменении постов, поэтому в общем кеше срок может быть большим.
+# В кеше 'local' сброс виден только своему процессу, и другие воркеры
+# отдавали бы старую страницу до истечения срока - он короткий.
+POSTS_PAGE_CACHE_TIMEOUT = (60 * 60 * 6 if CACHE_BACKEND == 'shared'
+                            else 20)
+
+# Лента подписок (posts.timeline): у авторов с большим числом подписчиков
+# посты не раскладываются по лентам, а подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 10000
+# Сколько последних постов автора переносить в ленту при подписке
+TIMELINE_BACKFILL = 1000
+TIMELINE_BATCH_SIZE = 500
+
+# Миниатюры картинок постов (posts.thumbnails): имя -> (геометрия, опции
+# sorl). Они готовятся заранее по очереди ThumbnailJob, которую разбирает
+# manage.py thumbnail_worker; пока их нет - шаблон показывает заглушку.
+# POSTS_THUMBNAIL_WORKERS > 0 разбирает очередь ещё и потоками
+# веб-процесса: так по умолчанию работает runserver в DEBUG, чтобы
+# картинки появлялись без отдельного worker
+POSTS_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+POSTS_THUMBNAIL_WORKERS = 2 if DEBUG and not TESTING else 0
+
+# Варианты картинок для <picture srcset> (posts.image_variants): ширины
+# с пропорцией карточки, форматы по убыванию предпочтения (недоступные
+# Pillow пропускаются, JPEG - запасной) и качество сжатия
+POSTS_IMAGE_WIDTHS = (320, 640, 960)
+POSTS_IMAGE_ASPECT = (960, 339)
+POSTS_IMAGE_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+POSTS_IMAGE_QUALITY = {'AVIF': 50, 'WEBP': 75, 'JPEG': 80}
+
+# Загрузка картинок (posts.uploads): размер файла и число пикселей
+# проверяются по заголовку до декодирования; оригиналы больше
+# POSTS_UPLOAD_MAX_SIDE уменьшаются (JPEG - сразу при декодировании),
+# EXIF удаляется. POSTS_UPLOAD_MEMORY_LIMIT - сколько памяти может
+# занять декодированная картинка при обработке одного запроса: PNG,
+# GIF и WebP декодируются целиком, поэтому для них настоящий предел -
+# около LIMIT / 5 пикселей (13 Мпикс при 64 МБ, posts.uploads).
+POSTS_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+POSTS_UPLOAD_MAX_PIXELS = 50_000_000
+POSTS_UPLOAD_MAX_SIDE = 2560
+POSTS_UPLOAD_MEMORY_LIMIT = 64 * 1024 * 1024
+POSTS_UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+POSTS_UPLOAD_QUALITY = 90
+
+# Сборка мусора в MEDIA_ROOT (manage.py collect_media): файлы моложе
+# POSTS_MEDIA_GC_MIN_AGE секунд не удаляются - пост с ними может ещё
+# сохраняться; прерванный обход продолжается с POSTS_MEDIA_GC_CHECKPOINT
+POSTS_MEDIA_GC_MIN_AGE = 60 * 60
+POSTS_MEDIA_GC_CHECKPOINT = os.path.join(BASE_DIR, 'media_gc.json')
 
 SYMBOLS_SHOWN = 15
 
@@ -154,10 +238,58 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-
-
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Раздача MEDIA_ROOT (core.views.serve_media). MEDIA_SENDFILE -
+# заголовок, которым файл передаётся фронтовому серверу: 'X-Sendfile'
+# (Apache, lighttpd) или 'X-Accel-Redirect' (nginx, internal-location
+# MEDIA_ACCEL_REDIRECT_PREFIX с alias на MEDIA_ROOT). None - Django сам
+# отдаёт файл кусками с поддержкой Range. Файлы под
+# MEDIA_IMMUTABLE_PREFIXES и с именем по содержимому не меняются
+# и кешируются навсегда
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+MEDIA_IMMUTABLE_PREFIXES = ('cache/', 'posts/variants/')
+MEDIA_CACHE_TIMEOUT = 60 * 60
+MEDIA_IMMUTABLE_TIMEOUT = 365 * 24 * 60 * 60
+
+
+# С CACHE_BACKEND = 'shared' все процессы делят один кеш в файле
+# SQLite (WAL), иначе каждый воркер держит свою копию страниц
+# и фрагментов. Горячие ключи (поколения, страницы, фрагменты,
+# карточки) ещё и копируются в память процесса; сигналы моделей
+# сбрасывают эти копии во всех процессах через файл cache.invalidate.
+# С 'local' у каждого процесса свой кеш в памяти.
+if CACHE_BACKEND == 'local':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.TwoTierCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000,
+                'LOCAL_TIMEOUT': 5,
+                'LOCAL_PREFIXES': [
+                    'generation:', 'page:', 'template.cache.', 'post_card:',
+                ],
+                'INVALIDATION_FILE': os.path.join(BASE_DIR,
+                                                  'cache.invalidate'),
+            },
+        },
+        'shared': {
+            'BACKEND': 'core.cache_backends.SQLiteCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+            'OPTIONS': {
+                'MAX_ENTRIES': 50000,
+            },
+        }
+    }
+
+# core.cache.single_flight: сколько отдавать устаревшее значение,
+# пока один процесс его пересчитывает, и сколько держать блокировку
+CACHE_STALE_TIMEOUT = 60
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_POLL = 0.05
@@ -13,10 +13,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from core.views import serve_media
 
 handler404 = 'core.views.page_not_found'
 handler500 = 'core.views.server_error'
@@ -30,7 +33,11 @@ urlpatterns = [
     path('about/', include('about.urls', namespace='about')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
+# Картинки отдаёт serve_media и в разработке, и на сервере: там сам файл
+# передаёт фронтовый сервер по заголовку MEDIA_SENDFILE.
+if settings.MEDIA_URL.startswith('/'):
+    urlpatterns += [
+        re_path(r'^{}(?P<path>.+)$'.format(
+            re.escape(settings.MEDIA_URL.lstrip('/'))),
+            serve_media, name='media'),
+    ]